@@ -0,0 +1,15 @@
+"""初始化一个不连接任何适配器的 NoneBot 并加载插件，供基准脚本离线导入插件模块"""
+import sys
+from pathlib import Path
+
+import nonebot
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+def setup(**config) -> None:
+    """config 会作为 NoneBot 配置项传入，例如 r6s_r6scn_base="http://127.0.0.1:8765" """
+    config.setdefault("log_level", "WARNING")
+    nonebot.init(driver="~none", **config)
+    nonebot.load_plugin("nonebot_plugin_r6s")
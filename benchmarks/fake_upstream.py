@@ -0,0 +1,197 @@
+"""本地上游替身：用 benchmarks/fixtures 中的数据模拟 r6s.cn、r6sground、r6stats 与头像 CDN
+
+    python benchmarks/fake_upstream.py [--port 8765] [--latency 0.08] [--route-latency r6scn=1.5] [--jitter 0.03]
+        [--error-rate 0.05] [--empty-rate 0.02] [--not-found-rate 0.05]
+
+默认同时监听 127.0.0.1 到 127.0.0.4，四个上游分别使用一个地址，
+这样插件按 host 的连接数限制与线上一致：
+
+    R6S_R6SCN_BASE=http://127.0.0.1:8765
+    R6S_GROUND_BASE=http://127.0.0.2:8765
+    R6S_STATS_BASE=http://127.0.0.3:8765
+    R6S_AVATAR_BASE=http://127.0.0.4:8765
+
+昵称以 notfound 开头的玩家总是返回未找到。GET /_stats 返回各路由的请求计数。
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import zlib
+from collections import Counter
+from io import BytesIO
+from typing import Dict, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from PIL import Image
+
+from fixtures import R6SCN, load_r6scn, load_r6sground
+
+Response = Tuple[int, bytes, Dict[str, str]]
+
+REASONS = {200: "OK", 304: "Not Modified", 404: "Not Found", 500: "Internal Server Error"}
+
+
+def user_id(name: str) -> str:
+    h = hashlib.md5(name.lower().encode()).hexdigest()
+    return "%s-%s-%s-%s-%s" % (h[:8], h[8:12], h[12:16], h[16:20], h[20:32])
+
+
+def avatar_png(seed: int) -> bytes:
+    img_io = BytesIO()
+    Image.new("RGB", (146, 146), (seed & 0xFF, seed >> 8 & 0xFF, seed >> 16 & 0xFF)).save(img_io, "PNG")
+    return img_io.getvalue()
+
+
+class Upstream:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        self.players = [load_r6scn(size) for size in R6SCN]
+        self.ground = load_r6sground()
+        self.counts: Counter = Counter()
+
+    def not_found(self, name: str) -> bool:
+        return name.lower().startswith("notfound") or self.rnd.random() < self.args.not_found_rate
+
+    def r6scn(self, name: str) -> Response:
+        if self.not_found(name):
+            return 200, b"{}", {}
+        # 多数玩家用 typical，每 10 个里有 1 个 small、1 个 worst
+        bucket = zlib.crc32(name.encode()) % 10
+        data = dict(self.players[0 if bucket == 0 else 2 if bucket == 1 else 1])
+        data["username"] = name
+        data["Casualstat"] = dict(data["Casualstat"], user_id=user_id(name))
+        return 200, json.dumps(data, ensure_ascii=False).encode(), {"content-type": "application/json"}
+
+    def stats_search(self, name: str) -> Response:
+        data = [] if self.not_found(name) else [{"ubisoft_id": user_id(name), "username": name}]
+        return 200, json.dumps({"data": data}).encode(), {"content-type": "application/json"}
+
+    def stats_generic(self, uid: str) -> Response:
+        data = self.players[1]
+        general = data["StatGeneral"][0]
+
+        def queue(d: dict) -> dict:
+            return {"kills": d["kills"], "deaths": d["deaths"], "wins": d["won"], "losses": d["lost"],
+                    "games_played": d["played"], "playtime": d["timePlayed"]}
+
+        body = {
+            "username": "Player.%s" % uid[:8],
+            "ubisoft_id": uid,
+            "progression": {"level": data["Basicstat"][0]["level"]},
+            "stats": {
+                "general": dict(queue(general), headshots=general["headshot"]),
+                "queue": {d["model"]: queue(d) for d in data["StatCR"]},
+            },
+            "operators": [
+                {"name": o["name"], "kills": o["kills"], "deaths": o["deaths"], "wins": o["won"],
+                 "losses": o["lost"], "playtime": o["timePlayed"]}
+                for o in data["StatOperator"]
+            ],
+        }
+        return 200, json.dumps(body).encode(), {"content-type": "application/json"}
+
+    def avatar(self, uid: str, headers: Dict[str, str]) -> Response:
+        etag = '"%08x"' % zlib.crc32(uid.encode())
+        if headers.get("if-none-match") == etag:
+            return 304, b"", {"etag": etag}
+        return 200, avatar_png(zlib.crc32(uid.encode())), {"content-type": "image/png", "etag": etag}
+
+    def route(self, target: str, headers: Dict[str, str]) -> Tuple[str, Response]:
+        url = urlsplit(target)
+        parts = [unquote(p) for p in url.path.split("/") if p]
+        if parts == ["Stats"]:
+            return "r6scn", self.r6scn(parse_qs(url.query).get("username", [""])[0])
+        if len(parts) == 3 and parts[0] == "stats" and parts[2] == "data":
+            return "ground", (200, self.ground, {"content-type": "text/event-stream"})
+        if len(parts) == 4 and parts[:2] == ["api", "player-search"]:
+            return "r6stats_search", self.stats_search(parts[2])
+        if len(parts) == 3 and parts[:2] == ["api", "stats"]:
+            return "r6stats", self.stats_generic(parts[2])
+        if len(parts) == 2 and parts[1].startswith("default_"):
+            return "avatar", self.avatar(parts[0], headers)
+        if parts == ["_stats"]:
+            return "_stats", (200, json.dumps(self.counts).encode(), {"content-type": "application/json"})
+        return "unknown", (404, b"", {})
+
+    async def respond(self, target: str, headers: Dict[str, str]) -> Response:
+        name, response = self.route(target, headers)
+        if name == "_stats":
+            return response
+        self.counts[name] += 1
+        latency = self.args.route_latency.get(name, self.args.latency)
+        delay = max(0.0, self.rnd.gauss(latency, self.args.jitter))
+        await asyncio.sleep(delay)
+        roll = self.rnd.random()
+        if roll < self.args.error_rate:
+            self.counts["error"] += 1
+            return 500, b"", {}
+        if roll < self.args.error_rate + self.args.empty_rate:
+            self.counts["empty"] += 1
+            return 200, b"", {}
+        return response
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                target = line.decode("latin-1").split(" ")[1]
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                status, body, extra = await self.respond(target, headers)
+                head = ["HTTP/1.1 %d %s" % (status, REASONS[status]), "content-length: %d" % len(body)]
+                head += ["%s: %s" % kv for kv in extra.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, IndexError):
+            pass
+        finally:
+            writer.close()
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--host", default="127.0.0.1,127.0.0.2,127.0.0.3,127.0.0.4", help="以逗号分隔的监听地址")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.08, help="平均响应延迟（秒）")
+    parser.add_argument(
+        "--route-latency",
+        type=lambda v: dict((k, float(t)) for k, t in (i.split("=") for i in v.split(","))),
+        default={},
+        help="按路由覆盖平均延迟，如 r6scn=1.5,ground=0.2；路由为 r6scn ground r6stats_search r6stats avatar",
+    )
+    parser.add_argument("--jitter", type=float, default=0.03, help="延迟的标准差（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    parser.add_argument("--empty-rate", type=float, default=0.0, help="返回 200 空响应体的比例")
+    parser.add_argument("--not-found-rate", type=float, default=0.0, help="随机返回未找到的比例")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+async def serve(args: argparse.Namespace) -> None:
+    upstream = Upstream(args)
+    hosts = args.host.split(",")
+    server = await asyncio.start_server(upstream.handle, hosts, args.port)
+    print("fake upstream listening on %s port %d" % (", ".join(hosts), args.port), flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    args = argparse.ArgumentParser(parents=[parser()]).parse_args()
+    asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    main()
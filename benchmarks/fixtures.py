@@ -0,0 +1,158 @@
+"""生成匿名化的基准数据
+
+r6s.cn 数据按真实接口的结构生成，昵称与 user_id 均为虚构；
+r6sground 数据按 !N$ 编号规则混淆。重新生成：
+
+    python benchmarks/fixtures.py
+"""
+import json
+import random
+from pathlib import Path
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+OPERATORS = [
+    "Ace", "Alibi", "Amaru", "Ash", "Bandit", "Blackbeard", "Buck", "Capitão",
+    "Castle", "Caveira", "Clash", "Doc", "Echo", "Ela", "Finka", "Frost", "Fuze",
+    "Glaz", "Goyo", "Hibana", "IQ", "Iana", "Jackal", "Jäger", "Kaid", "Kali",
+    "Kapkan", "Lesion", "Lion", "Maestro", "Maverick", "Melusi", "Mira",
+    "Montagne", "Mozzie", "Mute", "Nomad", "Nøkk", "Oryx", "Pulse", "Rook",
+    "Sledge", "Smoke", "Thatcher", "Thermite", "Twitch", "Valkyrie", "Vigil",
+    "Wamai", "Warden", "Ying", "Zero", "Zofia",
+    # 没有图标的新干员，走占位图
+    "Sens", "Grim", "Thorn", "Azami", "Solis", "Fenrir", "Tubarão",
+]
+
+
+def make_r6scn(name: str, seasons: int, operators: int, ranked: bool = True, seed: int = 0) -> dict:
+    rnd = random.Random(seed)
+
+    def cr(model: str) -> dict:
+        won, lost = rnd.randint(5, 900), rnd.randint(5, 900)
+        return {
+            "model": model,
+            "kills": rnd.randint(100, 20000),
+            "deaths": rnd.randint(100, 20000),
+            "timePlayed": rnd.randint(10000, 3000000),
+            "played": won + lost,
+            "won": won,
+            "lost": lost,
+            "update_at": {"time": 1600000000000 + rnd.randint(0, 10 ** 10)},
+        }
+
+    stat_cr = [cr("casual")] + ([cr("ranked")] if ranked else [])
+    season_ranks = [
+        {
+            "season": s,
+            "mmr": rnd.randint(1000, 4800),
+            "max_mmr": rnd.randint(1500, 5300),
+            "wins": rnd.randint(0, 200),
+            "losses": rnd.randint(0, 200),
+            "region": region,
+        }
+        # 上游会按地区重复返回同一赛季
+        for s in range(seasons, 0, -1)
+        for region in ("apac", "emea")
+    ]
+    return {
+        "username": name,
+        "Casualstat": {"user_id": "00000000-0000-4000-8000-%012d" % seed, "mmr": rnd.uniform(1500, 4500)},
+        "Basicstat": [
+            {"level": rnd.randint(1, 400), "platform": "uplay", "region": region, "mmr": rnd.uniform(1500, 4500)}
+            for region in ("apac", "emea", "ncsa")
+        ],
+        "StatGeneral": [
+            {
+                "kills": rnd.randint(1000, 50000),
+                "deaths": rnd.randint(1000, 50000),
+                "killAssists": rnd.randint(100, 9000),
+                "meleeKills": rnd.randint(0, 300),
+                "penetrationKills": rnd.randint(0, 3000),
+                "headshot": rnd.randint(100, 20000),
+                "revives": rnd.randint(0, 900),
+                "bulletsHit": rnd.randint(10000, 900000),
+                "bulletsFired": rnd.randint(100000, 9000000),
+                "timePlayed": rnd.randint(100000, 9000000),
+                "played": rnd.randint(100, 9000),
+                "won": rnd.randint(50, 4500),
+                "lost": rnd.randint(50, 4500),
+            }
+        ],
+        "StatCR": stat_cr,
+        "StatCR2": [cr("casual") for _ in range(4)],
+        "StatOperator": [
+            {
+                "name": OPERATORS[i % len(OPERATORS)],
+                "kills": rnd.randint(0, 3000),
+                "deaths": rnd.randint(1, 3000),
+                "timePlayed": rnd.randint(1000, 900000),
+                "won": rnd.randint(0, 300),
+                "lost": rnd.randint(0, 300),
+            }
+            for i in range(operators)
+        ],
+        "SeasonRanks": season_ranks,
+    }
+
+
+def make_r6sground(chunks: int, keys: int, seed: int = 0) -> bytes:
+    from nonebot_plugin_r6s.r6s_ground import TOKENS
+
+    words = {v.decode(): k.decode() for k, v in TOKENS.items()}
+
+    def obfuscate(text: str) -> str:
+        for word in sorted(words, key=len, reverse=True):
+            text = text.replace(word, "!%s$" % words[word])
+        return text
+
+    rnd = random.Random(seed)
+    stats = ["kills", "death", "matchwon", "matchlost", "matchplayed", "timeplayed", "headshot"]
+    user_main = {
+        "UsernameOnPlatform": "Player.Ground",
+        "!100$": 233,
+        "pvp_casual_skill_mean": 2712.3,
+        "rank_!28$_mmr": 3120.5,
+    }
+    for mode in ("generalpvp", "casualpvp", "rankedpvp"):
+        for stat in stats:
+            user_main["%s_%s:infinite" % (mode, stat)] = rnd.randint(1, 100000)
+    parts = [json.dumps({"key": "userMainData", "data": user_main})]
+    for i in range(chunks - 1):
+        data = {
+            "operatorpvp_%s_%d:infinite" % (rnd.choice(stats), j): rnd.choice([rnd.randint(0, 9999), True, False])
+            for j in range(keys)
+        }
+        parts.append(json.dumps({"key": "chunk%d" % i, "data": data}))
+    rnd.shuffle(parts)
+    return "".join("data: %s\n\n" % obfuscate(p) for p in parts).encode()
+
+
+R6SCN = {
+    "small": dict(name="Player.Small", seasons=1, operators=2, ranked=False, seed=1),
+    "typical": dict(name="Player.Typical", seasons=8, operators=20, seed=2),
+    "worst": dict(name="Player.WorstCaseLongName", seasons=35, operators=60, seed=3),
+}
+
+
+def load_r6scn(size: str) -> dict:
+    with open(FIXTURES / f"r6scn_{size}.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_r6sground() -> bytes:
+    return (FIXTURES / "r6sground_typical.txt").read_bytes()
+
+
+def main() -> None:
+    import bootstrap
+
+    bootstrap.setup()
+    FIXTURES.mkdir(exist_ok=True)
+    for size, kwargs in R6SCN.items():
+        with open(FIXTURES / f"r6scn_{size}.json", "w", encoding="utf-8") as f:
+            json.dump(make_r6scn(**kwargs), f, ensure_ascii=False, indent=1)
+    (FIXTURES / "r6sground_typical.txt").write_bytes(make_r6sground(12, 60))
+
+
+if __name__ == "__main__":
+    main()
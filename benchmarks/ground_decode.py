@@ -0,0 +1,58 @@
+"""r6sground 数据解码基准：旧的 re.split + 逐段 replace + 全量 json.loads 与 r6s_ground.decode 对比
+
+    python benchmarks/ground_decode.py [--chunks 40] [--keys 400] [--rounds 20]
+"""
+import argparse
+import re
+import time
+
+import ujson as json
+
+import bootstrap
+from fixtures import make_r6sground as make_payload
+
+bootstrap.setup()
+
+from nonebot_plugin_r6s.r6s_ground import decode  # noqa: E402
+
+
+def old_decode(text: str) -> dict:
+    datas = re.split(r"(data: )", text)
+    rdatas = {}
+    for d in datas:
+        if d[:1] != "{":
+            pass
+        else:
+            d = d.replace("!46$", "false")
+            d = d.replace("!47$", "true")
+            d_jdson = json.loads(d)
+            rdatas[d_jdson["key"]] = d_jdson["data"]
+    return rdatas
+
+
+def bench(func, arg, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(arg)
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=40)
+    parser.add_argument("--keys", type=int, default=400)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    payload = make_payload(args.chunks, args.keys)
+    old = old_decode(payload.decode())["userMainData"]
+    new = decode(payload)["userMainData"]
+    assert new["generalpvp_kills:infinite"] == old["!15$_!6$s:!5$"]
+
+    print("payload: %.1f KiB, %d chunks" % (len(payload) / 1024, args.chunks))
+    print("old path : %8.2f ms" % bench(lambda p: old_decode(p.decode()), payload, args.rounds))
+    print("decode   : %8.2f ms" % bench(decode, payload, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
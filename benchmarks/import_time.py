@@ -0,0 +1,47 @@
+"""在新的解释器中测量加载插件的耗时，不含 NoneBot 本身的初始化
+
+    python benchmarks/import_time.py [-n 5]
+
+每轮都在空的临时目录中启动，同时检查加载插件时没有创建 cache 目录或其他文件。
+配合 python -X importtime 可以查看各模块的导入耗时。
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).parent.parent
+CODE = """
+import os, sys, time
+sys.path.insert(0, %r)
+import nonebot
+nonebot.init(driver="~none", log_level="WARNING")
+start = time.perf_counter()
+nonebot.load_plugin("nonebot_plugin_r6s")
+print(time.perf_counter() - start, len(os.listdir(".")))
+""" % str(ROOT)
+
+
+def measure() -> float:
+    """返回加载插件的秒数"""
+    with tempfile.TemporaryDirectory() as cwd:
+        out = subprocess.run(
+            [sys.executable, "-c", CODE], cwd=cwd, check=True, stdout=subprocess.PIPE, universal_newlines=True
+        ).stdout.splitlines()[-1].split()  # NoneBot 的日志也输出到 stdout，结果在最后一行
+    if int(out[1]):
+        raise RuntimeError("加载插件时在工作目录中创建了文件")
+    return float(out[0])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rounds", type=int, default=5)
+    args = parser.parse_args()
+    times: List[float] = sorted(measure() for _ in range(args.rounds))
+    print("加载插件 %d 轮：最快 %.1f ms，中位数 %.1f ms" % (args.rounds, times[0] * 1000, times[len(times) // 2] * 1000))
+
+
+if __name__ == "__main__":
+    main()
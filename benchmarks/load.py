@@ -0,0 +1,194 @@
+"""端到端压测：启动 fake_upstream 并把插件的上游地址指向它，并发调用指令处理函数，统计吞吐与延迟分位
+
+    python benchmarks/load.py [-n 500] [-c 50] [--users 100] [--commands r6s,r6spro,r6sops,r6sp,compare]
+        [--no-cache] [--limit] [--metrics] [--upstream 8765] [fake_upstream 的参数，如 --latency 0.1 --error-rate 0.05]
+
+未指定 --upstream 时在空闲端口上另起一个 fake_upstream 进程，其余未识别的参数原样传给它。
+插件的缓存与绑定文件写在临时目录中，不影响当前目录。
+"""
+import argparse
+import asyncio
+import inspect
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+import bootstrap
+
+HERE = Path(__file__).parent
+
+
+class FakeEvent:
+    def __init__(self, user_id: int, group_id: Optional[int]) -> None:
+        self.user_id = user_id
+        self.group_id = group_id
+
+    def get_user_id(self) -> str:
+        return str(self.user_id)
+
+
+class FakeMatcher:
+    """只实现处理函数用到的 finish，与真实 Matcher 一样通过 FinishedException 结束处理"""
+
+    def __init__(self) -> None:
+        self.message = None
+
+    async def finish(self, message=None, **kwargs) -> None:
+        from nonebot.exception import FinishedException
+
+        self.message = message
+        raise FinishedException
+
+
+def outcome(message) -> str:
+    if getattr(message, "type", None) == "image":
+        return "image"
+    text = str(message)
+    if text.startswith("未找到"):
+        return "not found"
+    if text.startswith("查询干员出错"):
+        return "error"
+    if "太频繁" in text or "太多了" in text:
+        return "limited"
+    return "other"
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_upstream(extra: List[str]) -> "tuple[subprocess.Popen, int]":
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, str(HERE / "fake_upstream.py"), "--port", str(port), *extra],
+        stdout=subprocess.PIPE,
+    )
+    proc.stdout.readline()  # 等待 listening 输出
+    return proc, port
+
+
+async def run(args: argparse.Namespace, base: str) -> None:
+    from nonebot.exception import FinishedException
+
+    import nonebot_plugin_r6s as plugin
+
+    handlers = {
+        "r6s": plugin.base_image,
+        "r6spro": plugin.detail_image,
+        "r6sops": plugin.operators_img,
+        "r6sp": plugin.plays_image,
+    }
+    for func in (plugin.init_client, plugin.bindings.load, plugin.sprites.load, plugin.render_pool.start, plugin.outbox.start):
+        result = func()
+        if inspect.isawaitable(result):
+            await result
+
+    rnd = random.Random(args.seed)
+    users = ["Player%04d" % i for i in range(args.users)]
+    commands = args.commands.split(",")
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    outcomes: Counter = Counter()
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def one(i: int) -> None:
+        command = rnd.choice(commands)
+        event = FakeEvent(10000 + i, 20000 + i % 7)
+        matcher = FakeMatcher()
+        async with limit:
+            start = time.perf_counter()
+            try:
+                if command == "compare":
+                    await plugin.batch_handler(matcher, rnd.sample(users, min(3, len(users))), event)
+                else:
+                    await plugin.new_handler(matcher, rnd.choice(users), handlers[command], event)
+            except FinishedException:
+                outcomes[outcome(matcher.message)] += 1
+            except Exception:
+                outcomes["exception"] += 1
+            latencies[command].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    print("%d 条指令，并发 %d，用时 %.2f s，吞吐 %.1f 条/s" % (args.requests, args.concurrency, elapsed, args.requests / elapsed))
+    print("%-10s %6s %9s %9s %9s %9s" % ("command", "count", "p50 ms", "p95 ms", "p99 ms", "max ms"))
+    rows = sorted(latencies.items()) + [("all", [t for ts in latencies.values() for t in ts])]
+    for command, ts in rows:
+        print(
+            "%-10s %6d %9.1f %9.1f %9.1f %9.1f"
+            % (command, len(ts), *(percentile(ts, p) * 1000 for p in (50, 95, 99)), max(ts) * 1000)
+        )
+    print("结果：" + "，".join("%s %d" % kv for kv in outcomes.most_common()))
+    async with httpx.AsyncClient() as client:
+        print("上游请求：" + (await client.get(base + "/_stats")).text)
+    if args.metrics:
+        print(plugin.metrics.summary())
+
+    await plugin.bindings.close()
+    await plugin.outbox.stop()
+    await plugin.close_client()
+    plugin.render_pool.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(epilog="其余参数传给 fake_upstream.py")
+    parser.add_argument("-n", "--requests", type=int, default=500)
+    parser.add_argument("-c", "--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=100, help="参与查询的不同昵称数")
+    parser.add_argument("--commands", default="r6s,r6spro,r6sops,r6sp,compare")
+    parser.add_argument("--no-cache", action="store_true", help="关闭玩家数据与卡片缓存")
+    parser.add_argument("--limit", action="store_true", help="保留插件默认的限流设置，默认压测时关闭限流")
+    parser.add_argument("--metrics", action="store_true", help="开启插件指标并在结束时输出汇总")
+    parser.add_argument("--upstream", type=int, help="已在运行的 fake_upstream 的端口")
+    parser.add_argument("--delivery", default="base64", choices=("base64", "file", "http"), help="卡片发送方式")
+    parser.add_argument("--seed", type=int, default=0)
+    args, extra = parser.parse_known_args()
+
+    proc = None
+    port = args.upstream
+    if port is None:
+        proc, port = start_upstream(extra)
+    base = "http://127.0.0.1:%d" % port
+    config = dict(
+        r6s_r6scn_base=base,
+        r6s_ground_base="http://127.0.0.2:%d" % port,
+        r6s_stats_base="http://127.0.0.3:%d" % port,
+        r6s_avatar_base="http://127.0.0.4:%d" % port,
+        r6s_delivery=args.delivery,
+    )
+    if not args.limit:
+        config.update(r6s_limit_user_rate=0, r6s_limit_group_rate=0, r6s_limit_concurrency=0)
+    if args.metrics:
+        config.update(r6s_metrics=True)
+    if args.no_cache:
+        config.update(r6s_player_cache_ttl=0, r6s_card_cache_memory=0, r6s_card_cache_disk=0)
+    os.chdir(tempfile.mkdtemp(prefix="r6s-load-"))
+    try:
+        bootstrap.setup(**config)
+        asyncio.run(run(args, base))
+    finally:
+        if proc is not None:
+            proc.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""离线基准：用 benchmarks/fixtures 下的匿名数据测量解析、渲染、编码各阶段的耗时与峰值内存
+
+    python benchmarks/run.py [--only render] [--save out.json] [--compare out.json] [--tolerance 0.25]
+
+import:plugin 在新的解释器中测量加载插件的耗时（见 import_time.py）；
+其余阶段先计时若干轮，再在 tracemalloc 下单独跑一轮记录 Python 堆峰值；
+Pillow 的像素缓冲不经过 Python 分配器，渲染阶段另外列出画布大小，编码阶段列出输出大小。
+阶段耗时超过 thresholds.json 中的上限，或比 --compare 的基线慢出 tolerance 以上时以非零状态退出。
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import bootstrap
+import import_time
+from fixtures import R6SCN, load_r6scn, load_r6sground
+
+bootstrap.setup()
+
+from nonebot_plugin_r6s.image import (  # noqa: E402
+    encode_b64,
+    encode_image,
+    render_base,
+    render_detail,
+    render_operators,
+    render_plays,
+)
+from nonebot_plugin_r6s.config import EncodeOptions  # noqa: E402
+from nonebot_plugin_r6s.player import Player, new_player_from_r6scn  # noqa: E402
+from nonebot_plugin_r6s.r6s_ground import decode, trans_data  # noqa: E402
+
+THRESHOLDS = Path(__file__).parent / "thresholds.json"
+
+# 干员卡片在各编码方式下的耗时与体积，用于比较默认编码方式的取舍
+ENCODINGS = {
+    "png_rgba": EncodeOptions(flatten=False, colors=0),
+    "png_rgb": EncodeOptions(colors=0),
+    "png_rgb_256": EncodeOptions(),
+    "png_rgb_256_c1": EncodeOptions(compress_level=1),
+    "png_rgb_16": EncodeOptions(colors=16),
+    "jpeg_q85": EncodeOptions(format="jpeg"),
+    "webp_q85": EncodeOptions(format="webp"),
+}
+
+RENDERERS = {
+    "base": render_base,
+    "detail": render_detail,
+    "plays": render_plays,
+    "operators": render_operators,
+}
+
+
+def parse(data: dict) -> Player:
+    # 懒解析的部分也一并展开，避免把解析成本算进渲染阶段
+    player = new_player_from_r6scn(data)
+    player.season_rank, player.recent_stat, player.operator_stat
+    return player
+
+
+class Stage:
+    def __init__(self, name: str, func: Callable[[], object]) -> None:
+        self.name = name
+        self.func = func
+        self.times: List[float] = []
+        self.peak = 0
+        self.canvas = 0
+        self.output = 0
+
+    def run(self, min_time: float, min_rounds: int) -> None:
+        result = self.func()  # 预热，字形与模板缓存在这里建立
+        if hasattr(result, "size") and hasattr(result, "getbands"):
+            w, h = result.size
+            self.canvas = w * h * len(result.getbands())
+        elif isinstance(result, (bytes, str)):
+            self.output = len(result)
+        start = time.perf_counter()
+        while len(self.times) < min_rounds or time.perf_counter() - start < min_time:
+            t = time.perf_counter()
+            self.func()
+            self.times.append(time.perf_counter() - t)
+        tracemalloc.start()
+        self.func()
+        self.peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    @property
+    def mean(self) -> float:
+        return sum(self.times) / len(self.times) * 1000
+
+    @property
+    def best(self) -> float:
+        return min(self.times) * 1000
+
+
+class ImportStage(Stage):
+    """每轮在新的解释器中加载插件，记录的是插件自身的加载耗时"""
+
+    def __init__(self) -> None:
+        super().__init__("import:plugin", import_time.measure)
+
+    def run(self, min_time: float, min_rounds: int) -> None:
+        self.times = [import_time.measure() for _ in range(min_rounds)]
+
+
+def build_stages() -> List[Stage]:
+    stages: List[Stage] = [ImportStage()]
+    for size in R6SCN:
+        data = load_r6scn(size)
+        player = parse(data)
+        stages.append(Stage(f"parse:{size}", lambda d=data: parse(d)))
+        for card, render in RENDERERS.items():
+            stages.append(Stage(f"render_{card}:{size}", lambda r=render, p=player: r(p, None)))
+            if size == "typical":
+                stages.append(Stage(f"render_{card}@0.5:{size}", lambda r=render, p=player: r(p, None, 0.5)))
+        img = render_operators(player, None)
+        stages.append(Stage(f"encode_b64:{size}", lambda i=img: encode_b64(i)))
+        stages.append(Stage(f"encode_card:{size}", lambda i=img: encode_image(i, EncodeOptions())))
+        if size == "typical":
+            for name, options in ENCODINGS.items():
+                stages.append(Stage(f"encode_{name}:{size}", lambda i=img, o=options: encode_image(i, o)))
+    payload = load_r6sground()
+    decoded = decode(payload)
+    stages.append(Stage("ground_decode:typical", lambda: decode(payload)))
+    stages.append(Stage("ground_trans:typical", lambda: trans_data(decoded)))
+    return stages
+
+
+def check(
+    stages: List[Stage], thresholds: Dict[str, float], baseline: Optional[Dict[str, float]], tolerance: float
+) -> List[str]:
+    failures = []
+    for stage in stages:
+        limit = thresholds.get(stage.name)
+        if limit is not None and stage.best > limit:
+            failures.append("%s: %.2f ms > 上限 %.2f ms" % (stage.name, stage.best, limit))
+        if baseline and stage.name in baseline:
+            base = baseline[stage.name]
+            if stage.best > base * (1 + tolerance):
+                failures.append("%s: %.2f ms，比基线 %.2f ms 慢 %.0f%%" % (stage.name, stage.best, base, (stage.best / base - 1) * 100))
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", default="", help="只运行名称包含该字符串的阶段")
+    parser.add_argument("--min-time", type=float, default=0.3, help="每个阶段至少计时的秒数")
+    parser.add_argument("--min-rounds", type=int, default=5)
+    parser.add_argument("--save", type=Path, help="把本次各阶段最佳耗时写入 JSON，作为以后的基线")
+    parser.add_argument("--compare", type=Path, help="与之前 --save 的基线对比")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    stages = [s for s in build_stages() if args.only in s.name]
+    print("%-30s %10s %10s %12s %12s %10s" % ("stage", "best ms", "mean ms", "py peak KiB", "canvas KiB", "out KiB"))
+    for stage in stages:
+        stage.run(args.min_time, args.min_rounds)
+        print(
+            "%-30s %10.2f %10.2f %12.1f %12s %10s"
+            % (
+                stage.name,
+                stage.best,
+                stage.mean,
+                stage.peak / 1024,
+                "%.0f" % (stage.canvas / 1024) if stage.canvas else "-",
+                "%.0f" % (stage.output / 1024) if stage.output else "-",
+            )
+        )
+
+    if args.save:
+        args.save.write_text(json.dumps({s.name: round(s.best, 3) for s in stages}, indent=1))
+    thresholds = json.loads(THRESHOLDS.read_text())
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    failures = check(stages, thresholds, baseline, args.tolerance)
+    if failures:
+        print("\n性能回退：")
+        for failure in failures:
+            print("  " + failure)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
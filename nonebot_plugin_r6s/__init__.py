@@ -1,68 +1,216 @@
+import asyncio
 from types import FunctionType
-from nonebot import on_command
-from nonebot.adapters.onebot.v11.message import MessageSegment
+from typing import List
+from nonebot import get_driver, on_command
+from nonebot.log import logger
 from nonebot.rule import to_me
 from nonebot.matcher import Matcher
 from nonebot.params import ArgPlainText, CommandArg
 from nonebot.adapters.onebot.v11 import Event, Message
-import ujson as json
-import os
 
 from .r6s_data import *
-from .net import get_data_from_r6scn
+from .net import init_client, close_client
 from .image import *
-from .player import new_player_from_r6scn
+from .player import Player
+from .query import get_player, get_players, normalize_username, player_cache
+from .render import render_pool
+from .binding import bindings
+from .id_index import id_index
+from .config import plugin_config
+from .avatar import avatar_cache
+from .metrics import metrics, stats_collector
+from .limiter import RateLimited, limiter
+from .refresh import refresher
+from .history import history, trend
+from .delivery import outbox
 
 r6s = on_command("r6s", aliases={"彩六", "彩虹六号", "r6", "R6"}, priority=5, block=True)
 r6s_pro = on_command("r6spro", aliases={"r6pro", "R6pro"}, priority=5, block=True)
 r6s_ops = on_command("r6sops", aliases={"r6ops", "R6ops"}, priority=5, block=True)
 r6s_plays = on_command("r6sp", aliases={"r6p", "R6p"}, priority=5, block=True)
 r6s_set = on_command("r6sset", aliases={"r6set", "R6set"}, priority=5, block=True)
+r6s_trend = on_command("r6strend", aliases={"r6trend", "R6trend"}, priority=5, block=True)
 
-_cachepath = os.path.join("cache", "r6s.json")
-ground_can_do = (base, pro)  # ground数据源乱码过多，干员和近期战绩还在努力解码中···
+driver = get_driver()
+driver.on_startup(init_client)
+driver.on_startup(bindings.load)
+driver.on_startup(id_index.load)
+driver.on_startup(warm_up)
+driver.on_startup(render_pool.start)
+driver.on_startup(metrics.start)
+driver.on_startup(refresher.start)
+driver.on_startup(outbox.start)
+driver.on_shutdown(refresher.stop)
+driver.on_shutdown(bindings.close)
+driver.on_shutdown(id_index.close)
+driver.on_shutdown(close_client)
+driver.on_shutdown(render_pool.shutdown)
+driver.on_shutdown(metrics.stop)
+driver.on_shutdown(outbox.stop)
+
+CACHE_METRICS = {
+    "hits": "r6s_cache_hits_total",
+    "disk_hits": "r6s_cache_disk_hits_total",
+    "misses": "r6s_cache_misses_total",
+}
+metrics.collector(stats_collector(player_cache.stats, {"cache": "player"}, CACHE_METRICS))
+metrics.collector(stats_collector(card_cache.stats, {"cache": "card"}, CACHE_METRICS))
+metrics.collector(stats_collector(avatar_cache.stats, {"cache": "avatar"}, CACHE_METRICS))
+metrics.collector(
+    stats_collector(
+        render_pool.stats,
+        {},
+        {
+            "pending": "r6s_render_pending",
+            "max_pending": "r6s_render_max_pending",
+            "completed": "r6s_render_completed_total",
+            "failed": "r6s_render_failed_total",
+        },
+    )
+)
 
-if not os.path.exists("cache"):
-    os.makedirs("cache")
+for result in ("admitted", "queued", "rejected_user", "rejected_group", "rejected_busy", "rejected_timeout"):
+    metrics.collector(stats_collector(limiter.stats, {"result": result}, {result: "r6s_admission_total"}))
+metrics.collector(
+    stats_collector(limiter.stats, {}, {"active": "r6s_admission_active", "waiting": "r6s_admission_waiting"})
+)
+for result in ("ok", "not_found", "error"):
+    metrics.collector(stats_collector(refresher.stats, {"result": result}, {result: "r6s_refresh_total"}))
+metrics.collector(stats_collector(refresher.stats, {}, {"backoff": "r6s_refresh_backoff_seconds"}))
+for mode in ("base64", "file", "http"):
+    metrics.collector(stats_collector(outbox.stats, {"mode": mode}, {mode: "r6s_delivery_total"}))
+metrics.collector(stats_collector(outbox.stats, {}, {"failed": "r6s_delivery_failed_total"}))
 
-if not os.path.exists(_cachepath):
-    with open(_cachepath, "w", encoding="utf-8") as f:
-        f.write("{}")
+ground_can_do = (base, pro)  # ground数据源乱码过多，干员和近期战绩还在努力解码中···
 
 
 def set_usr_args(matcher: Matcher, event: Event, msg: Message):
     if msg.extract_plain_text():
         matcher.set_arg("username", msg)
     else:
-        with open(_cachepath, "r", encoding="utf-8") as f:
-            data: dict = json.load(f)
-        username = data.get(event.get_user_id())
+        username = bindings.get(event.get_user_id())
         if username:
+            refresher.touch(username)
             matcher.set_arg("username", Message(username))
 
 
-async def new_handler(matcher: Matcher, username: str, func: FunctionType):
-    data = await get_data_from_r6scn(username)
-    if data == "Not Found":
-        await matcher.finish("未找到干员『%s』" % username)
+async def admit(matcher: Matcher, event: Event, cost: int = 1):
+    """限流与并发准入，被拒绝时直接回复并结束处理；通过后须调用 limiter.release"""
+    group_id = getattr(event, "group_id", None)
+    try:
+        await limiter.acquire(event.get_user_id(), None if group_id is None else str(group_id), cost)
+    except RateLimited as e:
+        await matcher.finish(e.message)
+
+
+async def render_failed(matcher: Matcher, e: Exception):
+    """绘图出错（如找不到字体）时记录日志并回复，不让异常吞掉这次查询"""
+    logger.opt(exception=e).error("生成卡片失败: %r" % e)
+    await matcher.finish("生成图片出错，请联系管理员查看日志")
+
+
+async def new_handler(matcher: Matcher, username: str, func: FunctionType, event: Event):
+    await admit(matcher, event)
     try:
-        player = new_player_from_r6scn(data)
-    except:
-        await matcher.finish("查询干员出错『%s』" % username)
-        return
-    img_b64 = encode_b64(await func(player))
-    await matcher.finish(MessageSegment.image(file=f"base64://{img_b64}"))
+        await card_handler(matcher, username, func, event)
+    finally:
+        limiter.release()
+
+
+async def card_handler(matcher: Matcher, username: str, func: FunctionType, event: Event):
+    with metrics.span("handler", card=CARDS[func].name):
+        try:
+            with metrics.span("query"):
+                player = await get_player(username)
+        except:
+            await matcher.finish("查询干员出错『%s』" % username)
+            return
+        if not player:
+            await matcher.finish("查询干员出错『%s』" % username)
+        if player == "Not Found":
+            await matcher.finish("未找到干员『%s』" % username)
+        group_id = getattr(event, "group_id", None)
+        try:
+            data = await render_card(func, player, None if group_id is None else str(group_id))
+        except Exception as e:
+            await render_failed(matcher, e)
+        await matcher.finish(await outbox.segment(data))
+
+
+async def batch_handler(matcher: Matcher, usernames: List[str], event: Event):
+    names = []
+    seen = set()
+    for name in usernames:
+        if normalize_username(name) not in seen:
+            seen.add(normalize_username(name))
+            names.append(name)
+    names = names[: plugin_config.r6s_batch_max]
+    # 对比查询按人数消耗令牌
+    await admit(matcher, event, len(names))
+    try:
+        await compare_handler(matcher, names, event)
+    finally:
+        limiter.release()
+
+
+async def compare_handler(matcher: Matcher, names: List[str], event: Event):
+    with metrics.span("handler", card="compare"):
+        with metrics.span("query"):
+            players = await get_players(names)
+        if all(p == "Error" for p in players):
+            await matcher.finish("查询干员出错『%s』" % "、".join(names))
+        if all(not isinstance(p, Player) for p in players):
+            await matcher.finish("未找到干员『%s』" % "、".join(names))
+        group_id = getattr(event, "group_id", None)
+        try:
+            data = await render_compare_card(
+                players, names, None if group_id is None else str(group_id)
+            )
+        except Exception as e:
+            await render_failed(matcher, e)
+        await matcher.finish(await outbox.segment(data))
+
+
+async def trend_handler(matcher: Matcher, username: str, event: Event):
+    await admit(matcher, event)
+    try:
+        await trend_card_handler(matcher, username, event)
+    finally:
+        limiter.release()
+
+
+async def trend_card_handler(matcher: Matcher, username: str, event: Event):
+    """趋势图只使用本地记录的历史数据，不请求上游"""
+    with metrics.span("handler", card="trend"):
+        ubi_id = id_index.get_id(username)
+        columns = None
+        if ubi_id is not None:
+            columns = await asyncio.get_event_loop().run_in_executor(None, history.load, ubi_id)
+        days, window = plugin_config.r6s_trend_days, plugin_config.r6s_trend_window
+        data = None if columns is None else trend(columns, days, window)
+        if data is None:
+            await matcher.finish("暂无干员『%s』的历史数据，多查询几次后再来看看吧" % username)
+        group_id = getattr(event, "group_id", None)
+        try:
+            data = await render_trend_card(
+                id_index.get_name(ubi_id) or username,
+                ubi_id,
+                data,
+                days,
+                window,
+                None if group_id is None else str(group_id),
+            )
+        except Exception as e:
+            await render_failed(matcher, e)
+        await matcher.finish(await outbox.segment(data))
 
 
 @r6s_set.handle()
 async def r6s_set_handler(event: Event, args: Message = CommandArg()):
     args = args.extract_plain_text()
     if args:
-        with open(_cachepath, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        data[event.get_user_id()] = args
-        with open(_cachepath, "w", encoding="utf-8") as f:
-            json.dump(data, f)
+        bindings.set(event.get_user_id(), args)
+        refresher.touch(args)
         await r6s_set.finish("已设置ID：%s" % args)
 
 
@@ -72,8 +220,12 @@ async def _(matcher: Matcher, event: Event, msg: Message = CommandArg()):
 
 
 @r6s.got("username", prompt="请输入查询的角色昵称")
-async def _(username: str = ArgPlainText()):
-    await new_handler(r6s, username, base_image)
+async def _(event: Event, username: str = ArgPlainText()):
+    usernames = username.split()
+    if len(usernames) > 1:
+        await batch_handler(r6s, usernames, event)
+    else:
+        await new_handler(r6s, username, base_image, event)
 
 
 @r6s_pro.handle()
@@ -82,8 +234,8 @@ async def _(matcher: Matcher, event: Event, msg: Message = CommandArg()):
 
 
 @r6s_pro.got("username", prompt="请输入查询的角色昵称")
-async def _(username: str = ArgPlainText()):
-    await new_handler(r6s, username, detail_image)
+async def _(event: Event, username: str = ArgPlainText()):
+    await new_handler(r6s, username, detail_image, event)
 
 
 @r6s_ops.handle()
@@ -92,8 +244,8 @@ async def _(matcher: Matcher, event: Event, msg: Message = CommandArg()):
 
 
 @r6s_ops.got("username", prompt="请输入查询的角色昵称")
-async def _(username: str = ArgPlainText()):
-    await new_handler(r6s, username, operators_img)
+async def _(event: Event, username: str = ArgPlainText()):
+    await new_handler(r6s, username, operators_img, event)
 
 
 @r6s_plays.handle()
@@ -102,5 +254,15 @@ async def _(matcher: Matcher, event: Event, msg: Message = CommandArg()):
 
 
 @r6s_plays.got("username", prompt="请输入查询的角色昵称")
-async def _(username: str = ArgPlainText()):
-    await new_handler(r6s, username, plays_image)
+async def _(event: Event, username: str = ArgPlainText()):
+    await new_handler(r6s, username, plays_image, event)
+
+
+@r6s_trend.handle()
+async def _(matcher: Matcher, event: Event, msg: Message = CommandArg()):
+    set_usr_args(matcher, event, msg)
+
+
+@r6s_trend.got("username", prompt="请输入查询的角色昵称")
+async def _(event: Event, username: str = ArgPlainText()):
+    await trend_handler(r6s_trend, username, event)
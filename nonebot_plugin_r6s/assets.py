@@ -0,0 +1,145 @@
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from nonebot.log import logger
+from PIL import Image, ImageDraw, ImageFont
+from PIL.Image import Image as IMG
+
+from .config import plugin_config
+
+IMGS_PATH = Path(__file__).parent / "imgs"
+FONTS_PATH = Path(__file__).parent / "fonts"
+# 依次尝试的字体，只写文件名的由 Pillow 在系统字体目录中查找；卡片上有中文，只列出含中文字形的字体
+FONT_CANDIDATES = (
+    str(FONTS_PATH / "GenYoMin-M.ttc"),
+    "NotoSansCJK-Regular.ttc",
+    "NotoSerifCJK-Regular.ttc",
+    "SourceHanSansSC-Regular.otf",
+    "wqy-microhei.ttc",
+    "wqy-zenhei.ttc",
+    "msyh.ttc",
+    "simhei.ttf",
+    "PingFang.ttc",
+)
+
+RANK_SIZE = (150, 150)
+OPERATOR_SIZE = (170, 170)
+AVATAR_SIZE = (110, 110)
+
+
+class Sprite(NamedTuple):
+    image: IMG
+    mask: IMG  # 预先拆分的 alpha 通道，粘贴时直接使用
+
+
+def make_sprite(img: IMG, size: Tuple[int, int]) -> Sprite:
+    img = img.convert("RGBA").resize(size)
+    return Sprite(img, img.getchannel("A"))
+
+
+def placeholder(size: Tuple[int, int]) -> IMG:
+    img = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    pad = size[0] // 8
+    draw.ellipse([pad, pad, size[0] - pad, size[1] - pad], fill=(200, 200, 200, 255))
+    return img
+
+
+class SpriteStore:
+    """段位、干员图标的内存仓库，按卡片实际使用的尺寸缓存解码后的 RGBA 图"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._ranks: Dict[int, Path] = {}
+        self._operators: Dict[str, Path] = {}
+        self._sprites: Dict[tuple, Sprite] = {}
+        self._indexed = False
+
+    def index(self) -> None:
+        for p in (self.path / "ranks").glob("r*.png"):
+            self._ranks[int(p.stem[1:])] = p
+        for p in (self.path / "operators").glob("*.png"):
+            self._operators[p.stem.casefold()] = p
+        self._indexed = True
+
+    def load(self) -> None:
+        """建立索引并预先解码所有默认尺寸的图标"""
+        self.index()
+        for r in self._ranks:
+            self.rank(r)
+        for name in self._operators:
+            self.operator(name)
+        self.avatar()
+
+    def _get(self, key: tuple, path: Path, size: Tuple[int, int]) -> Sprite:
+        sprite = self._sprites.get(key)
+        if sprite is None:
+            if path is None:
+                sprite = make_sprite(placeholder(size), size)
+            else:
+                with Image.open(path) as img:
+                    sprite = make_sprite(img, size)
+            self._sprites[key] = sprite
+        return sprite
+
+    def rank(self, rank: int, size: Tuple[int, int] = RANK_SIZE) -> Sprite:
+        if not self._indexed:
+            self.index()
+        return self._get(("rank", rank, size), self._ranks.get(rank), size)
+
+    def operator(self, name: str, size: Tuple[int, int] = OPERATOR_SIZE) -> Sprite:
+        if not self._indexed:
+            self.index()
+        name = name.casefold()
+        # 缺少图标的新干员使用占位图
+        return self._get(("operator", name, size), self._operators.get(name), size)
+
+    def avatar(self, size: Tuple[int, int] = AVATAR_SIZE) -> Sprite:
+        return self._get(
+            ("avatar", size), self.path / "avatar" / "default_146_146.png", size
+        )
+
+
+class FontStore:
+    """卡片字体，首次使用时才加载，按字号缓存
+
+    使用候选列表中第一个能打开的字体，都打不开时绘制卡片会报错并提示设置 R6S_FONT；
+    字体在绘制时才加载，缺少字体文件不会让插件加载失败
+    """
+
+    def __init__(self, candidates: Tuple[str, ...]) -> None:
+        self.candidates = candidates
+        self._path: Optional[str] = None
+        self._fonts: Dict[int, ImageFont.ImageFont] = {}
+
+    @property
+    def path(self) -> str:
+        """实际使用的字体文件，没有可用的字体时为空字符串"""
+        if self._path is None:
+            for candidate in self.candidates:
+                try:
+                    ImageFont.truetype(candidate, 12)
+                except OSError:
+                    continue
+                self._path = candidate
+                break
+            else:
+                self._path = ""
+            if not self._path:
+                logger.error("未找到可用的中文字体，请通过 R6S_FONT 指定字体文件")
+            elif self._path != self.candidates[0]:
+                logger.warning("未找到字体 %s，使用 %s" % (self.candidates[0], self._path))
+        return self._path
+
+    def get(self, size: int) -> ImageFont.ImageFont:
+        font = self._fonts.get(size)
+        if font is None:
+            if not self.path:
+                # Pillow 内置的点阵字体只支持 latin-1，画不了卡片上的中文
+                raise OSError("未找到可用的字体，请通过 R6S_FONT 指定字体文件")
+            font = self._fonts[size] = ImageFont.truetype(self.path, size)
+        return font
+
+
+sprites = SpriteStore(IMGS_PATH)
+fonts = FontStore(((plugin_config.r6s_font,) if plugin_config.r6s_font else ()) + FONT_CANDIDATES)
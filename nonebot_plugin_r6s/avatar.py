@@ -0,0 +1,257 @@
+import os
+import time
+import asyncio
+import ujson as json
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from PIL import Image
+from PIL.Image import Image as IMG
+
+from .assets import AVATAR_SIZE
+from .cache import SingleFlight, TTLCache
+from .config import plugin_config
+from .net import fetch, fetch_retry
+
+AVATAR_BASE = plugin_config.r6s_avatar_base + "/{}/default_146_146.png"
+MISSING_TTL = 3600.0  # 头像不存在（404）时多久内不再请求（秒）
+
+
+def decode_avatar(data: bytes) -> IMG:
+    return Image.open(BytesIO(data)).convert("RGBA").resize(AVATAR_SIZE)
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    # 先写临时文件再替换，中途退出不会留下被截断的文件
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class AvatarCache:
+    """头像两级缓存：内存中缓存解码缩放后的图片，磁盘上缓存原始 PNG
+
+    命中磁盘缓存且超过 revalidate 秒未校验时，后台用条件请求刷新；
+    不存在的头像在 MISSING_TTL 内不再请求。磁盘读写都在线程池中进行，写入与淘汰依次执行
+    """
+
+    def __init__(self, path: Path, memory_size: int, disk_size: int, revalidate: float) -> None:
+        self.path = path
+        self.disk_size = disk_size
+        self.revalidate = revalidate
+        self._memory = TTLCache(memory_size, float("inf"))
+        self._missing = TTLCache(max(memory_size, 1) * 8, MISSING_TTL)
+        self._disk_used: Optional[int] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._flight = SingleFlight()
+        self._revalidating: Set[str] = set()
+        self._checked: Dict[str, float] = {}
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _png(self, user_id: str) -> Path:
+        return self.path / f"{user_id}.png"
+
+    def _meta(self, user_id: str) -> Path:
+        return self.path / f"{user_id}.json"
+
+    def _read_meta(self, user_id: str) -> dict:
+        try:
+            with open(self._meta(user_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, user_id: str, meta: dict) -> None:
+        write_atomic(self._meta(user_id), json.dumps(meta).encode())
+
+    def _read_disk(self, user_id: str) -> Optional[bytes]:
+        png = self._png(user_id)
+        try:
+            data = png.read_bytes()
+        except OSError:
+            return None
+        os.utime(png)  # 以 mtime 作为磁盘层的 LRU 顺序
+        return data
+
+    def _write_disk(self, user_id: str, data: bytes, headers, checked: float) -> List[str]:
+        """写入头像与校验信息，返回因超出磁盘上限被淘汰的 user_id"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        png = self._png(user_id)
+        try:
+            old = png.stat().st_size
+        except OSError:
+            old = 0
+        write_atomic(png, data)
+        if self._disk_used is not None:
+            self._disk_used += len(data) - old
+        self._write_meta(
+            user_id,
+            {
+                "etag": headers.get("etag"),
+                "last_modified": headers.get("last-modified"),
+                "checked": checked,
+            },
+        )
+        return self._evict()
+
+    def _scan(self) -> list:
+        files = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".png"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.name[:-4]))
+        return files
+
+    def _evict(self) -> List[str]:
+        # 总大小只在启动后首次写入时统计一次，之后随写入累加，超出上限时才扫描目录
+        if self._disk_used is None:
+            self._disk_used = sum(size for _, size, _ in self._scan())
+        if self._disk_used <= self.disk_size:
+            return []
+        evicted = []
+        files = self._scan()
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, user_id in files:
+            if total <= self.disk_size:
+                break
+            for p in (self._png(user_id), self._meta(user_id)):
+                try:
+                    p.unlink()
+                except OSError:
+                    pass
+            evicted.append(user_id)
+            total -= size
+        self._disk_used = total
+        return evicted
+
+    async def _store(self, user_id: str, data: bytes, headers) -> None:
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        checked = self._checked[user_id] = time.time()
+        loop = asyncio.get_event_loop()
+        async with self._write_lock:
+            evicted = await loop.run_in_executor(None, self._write_disk, user_id, data, headers, checked)
+        for old in evicted:
+            if old != user_id:
+                self._memory.pop(old)
+                self._checked.pop(old, None)
+
+    async def _download(self, user_id: str) -> Optional[bytes]:
+        try:
+            r = await fetch_retry(AVATAR_BASE.format(user_id))
+        except Exception:
+            return None
+        if r.status_code == 404:
+            self._missing.set(user_id, True)
+            return None
+        if r.status_code != 200:
+            return None
+        try:
+            self._memory.set(user_id, decode_avatar(r.content))
+        except Exception:
+            return None
+        try:
+            await self._store(user_id, r.content, r.headers)
+        except OSError:
+            pass
+        return r.content
+
+    async def _revalidate_one(self, user_id: str) -> None:
+        loop = asyncio.get_event_loop()
+        try:
+            meta = await loop.run_in_executor(None, self._read_meta, user_id)
+            if user_id not in self._checked:
+                # 首次命中时才从磁盘得知上次校验的时间，未超过 revalidate 时不请求
+                self._checked[user_id] = meta.get("checked", 0)
+                if time.time() - self._checked[user_id] < self.revalidate:
+                    return
+            headers = {}
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+            r = await fetch(AVATAR_BASE.format(user_id), headers=headers)
+            if r.status_code == 304:
+                meta["checked"] = self._checked[user_id] = time.time()
+                await loop.run_in_executor(None, self._write_meta, user_id, meta)
+            elif r.status_code == 200 and r.content:
+                self._memory.set(user_id, decode_avatar(r.content))
+                await self._store(user_id, r.content, r.headers)
+        except Exception:
+            pass
+        finally:
+            self._revalidating.discard(user_id)
+
+    def _maybe_revalidate(self, user_id: str) -> None:
+        if user_id in self._revalidating:
+            return
+        checked = self._checked.get(user_id)
+        if checked is not None and time.time() - checked < self.revalidate:
+            return
+        self._revalidating.add(user_id)
+        asyncio.ensure_future(self._revalidate_one(user_id))
+
+    async def get_bytes(self, user_id: str) -> Optional[bytes]:
+        """返回原始 PNG，每次都读磁盘；绘制卡片用 get_image，命中内存时不读磁盘"""
+        if user_id in self._missing:
+            return None
+        data = await asyncio.get_event_loop().run_in_executor(None, self._read_disk, user_id)
+        if data is not None:
+            self.disk_hits += 1
+            self._maybe_revalidate(user_id)
+            return data
+        self.misses += 1
+        # 同一 user_id 的并发头像下载合并为一次
+        return await self._flight.do(user_id, lambda: self._download(user_id))
+
+    async def get_image(self, user_id: str) -> Optional[IMG]:
+        """返回缩放到 AVATAR_SIZE 的 RGBA 头像，获取失败返回 None"""
+        avatar = self._memory.get(user_id)
+        if avatar is not None:
+            self._maybe_revalidate(user_id)
+            return avatar
+        if user_id in self._missing:
+            return None
+        data = await self.get_bytes(user_id)
+        if data is None:
+            return None
+        avatar = self._memory.get(user_id)
+        if avatar is None:
+            try:
+                avatar = decode_avatar(data)
+            except Exception:
+                return None
+            self._memory.set(user_id, avatar)
+        return avatar
+
+    def prefetch(self, user_id: str) -> None:
+        """在后台提前下载并解码头像，之后的 get_image 直接命中内存或合并到同一次下载"""
+        if user_id and user_id not in self._memory and user_id not in self._missing:
+            asyncio.ensure_future(self._prefetch(user_id))
+
+    async def _prefetch(self, user_id: str) -> None:
+        try:
+            await self.get_image(user_id)
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "hits": self._memory.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+
+avatar_cache = AvatarCache(
+    Path("cache") / "avatars",
+    plugin_config.r6s_avatar_memory_size,
+    plugin_config.r6s_avatar_disk_size * 1024 * 1024,
+    plugin_config.r6s_avatar_revalidate,
+)
@@ -0,0 +1,87 @@
+import os
+import asyncio
+import ujson as json
+from pathlib import Path
+from typing import Dict, Optional
+
+from .config import plugin_config
+
+
+class BindingStore:
+    """QQ 号到游戏昵称的绑定
+
+    启动时读入整个文件，查询只走内存；写入先更新内存，
+    再在 flush_delay 秒后合并写盘（写临时文件后原子替换）
+    """
+
+    def __init__(self, path: Path, flush_delay: float) -> None:
+        self.path = path
+        self.flush_delay = flush_delay
+        self._data: Dict[str, str] = {}
+        self._loaded = False
+        self._dirty = False
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def load(self) -> None:
+        if self._loaded:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        self._data = {str(k): v for k, v in data.items()}
+        self._loaded = True
+
+    def __len__(self) -> int:
+        self.load()
+        return len(self._data)
+
+    def get(self, user_id: str) -> Optional[str]:
+        self.load()
+        return self._data.get(user_id)
+
+    def items(self):
+        self.load()
+        return list(self._data.items())
+
+    def set(self, user_id: str, username: str) -> None:
+        self.load()
+        self._data[user_id] = username
+        self._dirty = True
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(self.flush_delay)
+        await self.flush()
+
+    def _write(self, data: Dict[str, str]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    async def flush(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            data = dict(self._data)
+            try:
+                await asyncio.get_event_loop().run_in_executor(None, self._write, data)
+            except BaseException:
+                self._dirty = True
+                raise
+
+    async def close(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+
+
+bindings = BindingStore(Path("cache") / "r6s.json", plugin_config.r6s_binding_flush_delay)
@@ -0,0 +1,209 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """带过期时间的 LRU 缓存，超出 maxsize 时淘汰最久未使用的条目"""
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        item = self._data.get(key)
+        return item is not None and item[0] > time.monotonic()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expire, value = item
+        if expire <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class SingleFlight:
+    """合并同一 key 的并发调用，所有调用方等待同一个进行中的任务"""
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        fut = self._calls.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(func())
+            self._calls[key] = fut
+            fut.add_done_callback(lambda _: self._calls.pop(key, None))
+        # shield: 单个调用方被取消时不影响其他等待者
+        return await asyncio.shield(fut)
+
+
+class BlobCache:
+    """bytes 的内存 + 磁盘两级缓存，两级都按总字节数上限做 LRU 淘汰
+
+    磁盘层以 mtime 记录访问顺序，key 需是可以直接作为文件名的字符串；
+    磁盘读写与淘汰在线程池中进行，写入依次执行
+    """
+
+    def __init__(self, path: Path, memory_size: int, disk_size: int, suffix: str = "") -> None:
+        self.path = path
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.suffix = suffix
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_used = 0
+        self._disk_used: Optional[int] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+
+    def file(self, key: str) -> Path:
+        return self.path / f"{key}{self.suffix}"
+
+    def _memory_set(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory_size:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= len(old)
+        self._memory[key] = data
+        self._memory_used += len(data)
+        while self._memory_used > self.memory_size:
+            _, old = self._memory.popitem(last=False)
+            self._memory_used -= len(old)
+
+    def _disk_entries(self) -> list:
+        entries = []
+        for entry in os.scandir(self.path):
+            if (
+                entry.name.endswith(self.suffix)
+                and not entry.name.endswith(".tmp")
+                and entry.is_file()
+            ):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict_disk(self) -> None:
+        if self._disk_used is None:
+            self._disk_used = sum(size for _, size, _ in self._disk_entries())
+        if self._disk_used <= self.disk_size:
+            return
+        entries = self._disk_entries()
+        entries.sort()
+        self._disk_used = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._disk_used <= self.disk_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            self._disk_used -= size
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        file = self.file(key)
+        try:
+            data = file.read_bytes()
+            os.utime(file)
+        except OSError:
+            return None
+        return data
+
+    async def get(self, key: str) -> Optional[bytes]:
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return data
+        if self.disk_size > 0:
+            data = await asyncio.get_event_loop().run_in_executor(None, self._disk_get, key)
+            if data is not None:
+                self.disk_hits += 1
+                self._memory_set(key, data)
+                return data
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, data: bytes) -> None:
+        self._memory_set(key, data)
+        if self.disk_size <= 0 or len(data) > self.disk_size:
+            return
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        async with self._write_lock:
+            await asyncio.get_event_loop().run_in_executor(None, self._disk_set, key, data)
+
+    def _disk_set(self, key: str, data: bytes) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        file = self.file(key)
+        tmp = file.with_name(file.name + ".tmp")
+        tmp.write_bytes(data)
+        try:
+            old = file.stat().st_size
+        except OSError:
+            old = 0
+        os.replace(tmp, file)
+        if self._disk_used is not None:
+            self._disk_used += len(data) - old
+        self._evict_disk()
+
+    def stats(self) -> dict:
+        total = self.hits + self.disk_hits + self.misses
+        return {
+            "memory_used": self._memory_used,
+            "memory_entries": len(self._memory),
+            "disk_used": self._disk_used,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / total if total else 0.0,
+        }
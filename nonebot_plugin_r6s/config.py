@@ -0,0 +1,119 @@
+from typing import Dict, List
+
+from nonebot import get_driver
+from pydantic import BaseModel, Extra
+
+
+class EncodeOptions(BaseModel):
+    format: str = "png"  # png / jpeg / webp
+    flatten: bool = True  # 去掉 alpha 通道，卡片背景不透明，对 png 无损
+    colors: int = 256  # 大于 0 时量化为该颜色数的自适应调色板（png / webp），0 为关闭
+    compress_level: int = 6  # png 压缩等级 0-9
+    quality: int = 85  # jpeg / webp 质量
+
+
+class Config(BaseModel, extra=Extra.ignore):
+    # 上游地址，可指向镜像或本地的测试服务器
+    r6s_r6scn_base: str = "https://www.r6s.cn"
+    r6s_ground_base: str = "https://global.r6sground.cn"
+    r6s_stats_base: str = "https://r6stats.com"
+    r6s_avatar_base: str = "https://ubisoft-avatars.akamaized.net"
+
+    # 共享 HTTP 连接池
+    r6s_http_max_connections: int = 20
+    r6s_http_max_connections_per_host: int = 8
+    r6s_http_max_keepalive: int = 10
+    r6s_http_keepalive_expiry: float = 30.0
+    r6s_http2: bool = False  # 需要安装 httpx[http2]
+    r6s_http_timeout: float = 10.0
+    r6s_http_connect_timeout: float = 5.0
+
+    # 重试与熔断
+    r6s_retry_attempts: int = 4
+    r6s_retry_base_delay: float = 0.3
+    r6s_retry_max_delay: float = 2.0
+    r6s_retry_budget: float = 8.0  # 单次查询的总时长上限（秒）
+    r6s_breaker_threshold: int = 5  # 连续失败多少次后熔断
+    r6s_breaker_cooldown: float = 30.0  # 熔断后多久放行探测请求（秒）
+
+    # 数据源，按顺序对冲请求
+    r6s_sources: List[str] = ["r6scn", "r6sground", "r6stats"]
+    r6s_hedge_percentile: float = 0.95  # 前一个数据源超过其历史耗时的该分位数仍未返回时请求下一个
+    r6s_hedge_delay: float = 1.5  # 耗时样本不足时使用的对冲延迟（秒）
+    r6s_hedge_min_delay: float = 0.3
+    r6s_hedge_max_delay: float = 4.0
+
+    # 玩家数据缓存
+    r6s_player_cache_ttl: float = 60.0  # 秒，0 为关闭缓存
+    r6s_player_cache_size: int = 256
+
+    # 头像缓存
+    r6s_avatar_memory_size: int = 128  # 内存中缓存的头像数
+    r6s_avatar_disk_size: int = 50  # 磁盘缓存上限（MB）
+    r6s_avatar_revalidate: float = 86400.0  # 超过该时长（秒）后在后台校验头像是否更新
+
+    # 多人对比查询
+    r6s_batch_max: int = 5  # 一次对比查询的最大玩家数
+    r6s_batch_concurrency: int = 5  # 对比查询时同时请求的玩家数
+
+    # 查询限流，rate 为每秒补充的次数，0 为不限
+    r6s_limit_user_rate: float = 0.2
+    r6s_limit_user_burst: int = 3
+    r6s_limit_group_rate: float = 1.0
+    r6s_limit_group_burst: int = 10
+    r6s_limit_concurrency: int = 8  # 同时处理的查询数，0 为不限
+    r6s_limit_queue: int = 32  # 排队等待的查询数上限，超出时直接拒绝
+    r6s_limit_queue_timeout: float = 15.0  # 排队超过该时长（秒）时放弃
+
+    # 昵称绑定
+    r6s_binding_flush_delay: float = 5.0  # 设置昵称后合并写盘的延迟（秒）
+
+    # 玩家数据历史，用于趋势图
+    r6s_history_max_rows: int = 1000  # 每名玩家保留的快照数，0 为不记录
+    r6s_history_max_days: float = 180.0  # 快照保留天数
+    r6s_history_max_players: int = 5000  # 保留历史的玩家数上限
+    r6s_trend_days: int = 30  # 趋势图的统计天数
+    r6s_trend_window: int = 7  # 滚动 KD、胜率的窗口天数
+
+    # 后台刷新绑定玩家的数据
+    r6s_refresh_rate: float = 0  # 每秒刷新的玩家数，0 为关闭
+    r6s_refresh_hours: List[int] = []  # 允许刷新的时段（本地时间的小时），为空时全天
+    r6s_refresh_age: float = 1800.0  # 距上次刷新超过该时长（秒）的玩家才会再次刷新
+    r6s_refresh_ttl: float = 7200.0  # 刷新得到的数据在缓存中的有效期（秒）
+    r6s_refresh_max_backoff: float = 600.0  # 上游出错时刷新间隔退避的上限（秒）
+
+    # 昵称到 ubisoft_id 的索引
+    r6s_id_index_ttl: float = 30 * 86400  # 条目的有效期（秒）
+    r6s_id_index_size: int = 20000
+
+    # 渲染
+    r6s_font: str = ""  # 卡片字体文件，为空时使用插件自带的字体，缺少时依次尝试常见的系统中文字体
+    r6s_render_pool: str = "thread"  # thread / process / none
+    r6s_render_scale: float = 1.0  # 卡片的缩放比例，字号与图标随之缩放，如 0.5 时绘制、编码更快，图片更小
+    r6s_render_scale_groups: Dict[str, float] = {}  # 按群号单独设置缩放比例
+    r6s_render_workers: int = 2
+    r6s_card_cache_memory: int = 32  # 已编码卡片的内存缓存上限（MB），0 为关闭
+    r6s_card_cache_disk: int = 200  # 已编码卡片的磁盘缓存上限（MB），0 为关闭
+
+    # 卡片发送方式
+    r6s_delivery: str = "base64"  # base64 / file / http，file 需要 OneBot 实现与 bot 在同一台机器上
+    r6s_delivery_dir: str = "cache/outbox"  # file / http 模式下存放卡片文件的目录
+    r6s_delivery_host: str = "127.0.0.1"
+    r6s_delivery_port: int = 0  # http 模式下卡片文件服务的端口，0 为随机
+    r6s_delivery_url: str = ""  # OneBot 访问卡片文件服务的地址前缀，为空时为 http://host:port
+    r6s_delivery_max_size: int = 100  # 卡片文件的总大小上限（MB）
+    r6s_delivery_max_age: float = 600.0  # 卡片文件的保留时长（秒）
+
+    # 指标
+    r6s_metrics: bool = False  # 记录各阶段耗时、重试、错误与缓存命中
+    r6s_metrics_host: str = "127.0.0.1"
+    r6s_metrics_port: int = 0  # 大于 0 时在该端口提供 Prometheus 格式的 /metrics
+    r6s_metrics_log_interval: float = 0  # 大于 0 时按该间隔（秒）在日志中输出指标汇总
+
+    # 图片编码，按 群号 > 卡片类型（base / detail / plays / operators / compare）> 默认 的顺序选择
+    r6s_encode: EncodeOptions = EncodeOptions()
+    r6s_encode_cards: Dict[str, EncodeOptions] = {}
+    r6s_encode_groups: Dict[str, EncodeOptions] = {}
+
+
+plugin_config = Config.parse_obj(get_driver().config)
@@ -0,0 +1,178 @@
+import os
+import re
+import time
+import base64
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import Dict, Optional
+
+from nonebot.log import logger
+from nonebot.adapters.onebot.v11.message import MessageSegment
+
+from .config import plugin_config
+
+MODES = ("base64", "file", "http")
+CONTENT_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".webp": "image/webp"}
+NAME_RE = re.compile(r"[0-9a-f]{32}\.(png|jpg|webp)")
+# 距上次清理超过该时长（秒）后，下一次写入时按 max_age 清理
+CLEANUP_INTERVAL = 60.0
+
+
+def image_suffix(data: bytes) -> str:
+    if data[:2] == b"\xff\xd8":
+        return ".jpg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    return ".png"
+
+
+class CardOutbox:
+    """把编码后的卡片写入按内容寻址的目录，以 file:// 路径或本地 HTTP 地址发送，省去 base64 编码和 33% 的体积膨胀
+
+    文件名为内容的哈希，相同的卡片只写一次；超过 max_age 秒未发送或总大小超过 max_size 时删除最早的文件。
+    未启用、写入失败或 HTTP 服务未启动时回退到 base64
+    """
+
+    def __init__(self, path: Path, mode: str, max_size: int, max_age: float) -> None:
+        self.path = path
+        self.mode = mode
+        self.max_size = max_size
+        self.max_age = max_age
+        self.base_url = ""
+        self.sent: Dict[str, int] = {mode: 0 for mode in MODES}
+        self.failed = 0
+        self._used: Optional[int] = None
+        self._cleaned = 0.0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def file(self, data: bytes) -> Path:
+        return self.path / (hashlib.blake2b(data, digest_size=16).hexdigest() + image_suffix(data))
+
+    def _entries(self) -> list:
+        entries = []
+        for entry in os.scandir(self.path):
+            if NAME_RE.fullmatch(entry.name):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def cleanup(self) -> None:
+        """删除超过 max_age 的文件，剩余的总大小仍超过 max_size 时从最早的开始删除"""
+        entries = self._entries()
+        entries.sort()
+        used = sum(size for _, size, _ in entries)
+        expire = time.time() - self.max_age
+        for mtime, size, path in entries:
+            if mtime >= expire and used <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            used -= size
+        self._used = used
+        self._cleaned = time.monotonic()
+
+    def write(self, data: bytes) -> Path:
+        file = self.file(data)
+        try:
+            # 已有同样内容的文件时只刷新 mtime，避免刚发送就被清理
+            os.utime(file)
+        except FileNotFoundError:
+            self.path.mkdir(parents=True, exist_ok=True)
+            tmp = file.with_name(file.name + ".tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, file)
+            if self._used is not None:
+                self._used += len(data)
+        if (
+            self._used is None
+            or self._used > self.max_size
+            or time.monotonic() - self._cleaned > CLEANUP_INTERVAL
+        ):
+            self.cleanup()
+        return file
+
+    async def segment(self, data: bytes) -> MessageSegment:
+        """按配置的发送方式生成图片消息段"""
+        if self.mode == "file" or (self.mode == "http" and self.base_url):
+            loop = asyncio.get_event_loop()
+            try:
+                file = await loop.run_in_executor(None, self.write, data)
+            except OSError as e:
+                self.failed += 1
+                logger.warning("写入卡片文件失败，改用 base64 发送: %r" % e)
+            else:
+                self.sent[self.mode] += 1
+                if self.mode == "file":
+                    return MessageSegment.image(file=file.absolute().as_uri())
+                return MessageSegment.image(file=f"{self.base_url}/{file.name}")
+        self.sent["base64"] += 1
+        return MessageSegment.image(file=f"base64://{base64.b64encode(data).decode()}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = (await reader.readline()).split(b" ")
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            method, target = request[0], request[1].decode("latin-1") if len(request) > 2 else ""
+            name = target.lstrip("/")
+            body, status = b"", "404 Not Found"
+            # 只提供目录下按哈希命名的文件
+            if method in (b"GET", b"HEAD") and NAME_RE.fullmatch(name):
+                loop = asyncio.get_event_loop()
+                try:
+                    body = await loop.run_in_executor(None, (self.path / name).read_bytes)
+                    status = "200 OK"
+                except OSError:
+                    pass
+            content_type = CONTENT_TYPES.get(os.path.splitext(name)[1], "text/plain")
+            writer.write(
+                b"HTTP/1.1 %s\r\nContent-Type: %s\r\nContent-Length: %d\r\nCache-Control: max-age=%d\r\nConnection: close\r\n\r\n"
+                % (status.encode(), content_type.encode(), len(body), int(self.max_age))
+            )
+            if method != b"HEAD":
+                writer.write(body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> None:
+        if self.mode not in MODES:
+            logger.warning("未知的卡片发送方式 %s，改用 base64" % self.mode)
+            self.mode = "base64"
+        if self.mode != "http" or self._server is not None:
+            return
+        host, port = plugin_config.r6s_delivery_host, plugin_config.r6s_delivery_port
+        try:
+            self._server = await asyncio.start_server(self._handle, host, port)
+        except OSError as e:
+            logger.warning("卡片文件服务启动失败，改用 base64 发送: %r" % e)
+            return
+        port = self._server.sockets[0].getsockname()[1]
+        self.base_url = plugin_config.r6s_delivery_url.rstrip("/") or "http://%s:%d" % (host, port)
+        logger.info("r6s 卡片文件地址 %s" % self.base_url)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            self.base_url = ""
+
+    def stats(self) -> dict:
+        return {**self.sent, "failed": self.failed, "disk_used": self._used or 0}
+
+
+outbox = CardOutbox(
+    Path(plugin_config.r6s_delivery_dir),
+    plugin_config.r6s_delivery,
+    plugin_config.r6s_delivery_max_size * 1024 * 1024,
+    plugin_config.r6s_delivery_max_age,
+)
@@ -0,0 +1,227 @@
+import os
+import re
+import sys
+import time
+import struct
+import asyncio
+import hashlib
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from nonebot.log import logger
+
+from .config import plugin_config
+from .player import Player
+
+# 每行一次查询得到的快照，time 为秒级时间戳，MMR 取不到时记为 0
+COLUMNS = (
+    "time",
+    "kills",
+    "deaths",
+    "won",
+    "lost",
+    "played",
+    "time_played",
+    "casual_mmr",
+    "ranked_mmr",
+)
+MAGIC = b"R6H1"
+HEADER = struct.Struct("<4sI")
+# 各列按差分后的取值范围选用能放下的最小整数类型
+TYPECODES = ("b", "h", "i", "q")
+SAFE_ID_RE = re.compile(r"[0-9A-Za-z_-]{1,64}")
+
+Columns = Dict[str, array]
+
+
+def snapshot(player: Player, now: Optional[float] = None) -> Tuple[int, ...]:
+    general = player.gerneral_stat
+    ranked = player.ranked_stat
+    missing_mmr = "mmr" in player.missing
+    return (
+        int(time.time() if now is None else now),
+        getattr(general, "kills", 0) or 0,
+        getattr(general, "deaths", 0) or 0,
+        getattr(general, "won", 0) or 0,
+        getattr(general, "lost", 0) or 0,
+        getattr(general, "played", 0) or 0,
+        getattr(general, "timePlayed", 0) or 0,
+        0 if missing_mmr else int(getattr(player.casual_stat, "mmr", 0) or 0),
+        0 if missing_mmr or ranked is None else int(getattr(ranked, "mmr", 0) or 0),
+    )
+
+
+def _encode_column(values: array) -> bytes:
+    deltas = array("q", values[:1])
+    deltas.extend(b - a for a, b in zip(values, values[1:]))
+    lo, hi = min(deltas, default=0), max(deltas, default=0)
+    for typecode in TYPECODES:
+        bits = array(typecode).itemsize * 8
+        if -(1 << (bits - 1)) <= lo and hi < 1 << (bits - 1):
+            break
+    column = array(typecode, deltas)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return typecode.encode() + column.tobytes()
+
+
+def encode(columns: Columns) -> bytes:
+    """文件头之后逐列保存：1 字节类型码，接着是首个值和逐行差分值"""
+    rows = len(columns["time"])
+    return HEADER.pack(MAGIC, rows) + b"".join(_encode_column(columns[c]) for c in COLUMNS)
+
+
+def decode(data: bytes) -> Columns:
+    magic, rows = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("bad history file")
+    offset = HEADER.size
+    columns = {}
+    for name in COLUMNS:
+        typecode = chr(data[offset])
+        if typecode not in TYPECODES:
+            raise ValueError("bad history file")
+        size = array(typecode).itemsize * rows
+        column = array(typecode)
+        column.frombytes(data[offset + 1 : offset + 1 + size])
+        if len(column) != rows:
+            raise ValueError("truncated history file")
+        if sys.byteorder == "big":
+            column.byteswap()
+        columns[name] = array("q", accumulate(column))
+        offset += 1 + size
+    return columns
+
+
+class Trend(NamedTuple):
+    time: List[int]
+    kd: List[Optional[float]]  # 滚动窗口内的 KD，窗口内没有新的对局时为 None
+    win_rate: List[Optional[float]]  # 滚动窗口内的胜率（%）
+    casual_mmr: List[int]
+    ranked_mmr: List[int]
+    delta: Dict[str, int]  # 统计区间内各计数的增量
+
+
+def trend(columns: Columns, days: float = 30, window: float = 7) -> Optional[Trend]:
+    """最近 days 天的走势，KD 和胜率按 window 天的滚动窗口计算；快照不足两个时返回 None"""
+    times = columns["time"]
+    if len(times) < 2:
+        return None
+    start = bisect_left(times, times[-1] - days * 86400)
+    base = max(0, start - 1)  # 区间开始前最后一次快照作为增量的基准
+    idx = range(start, len(times))
+    prev = [max(base, bisect_left(times, times[i] - window * 86400)) for i in idx]
+
+    def diff(name: str) -> List[int]:
+        col = columns[name]
+        return [col[i] - col[j] for i, j in zip(idx, prev)]
+
+    kills, deaths, won, played = diff("kills"), diff("deaths"), diff("won"), diff("played")
+    return Trend(
+        time=list(times[start:]),
+        kd=[k / d if d > 0 else None for k, d in zip(kills, deaths)],
+        win_rate=[w / p * 100 if p > 0 else None for w, p in zip(won, played)],
+        casual_mmr=list(columns["casual_mmr"][start:]),
+        ranked_mmr=list(columns["ranked_mmr"][start:]),
+        delta={name: columns[name][-1] - columns[name][base] for name in COLUMNS[1:7]},
+    )
+
+
+class HistoryStore:
+    """查询得到的玩家数据快照，每名玩家一个按列差分编码的文件
+
+    计数没有变化的快照不记录；每名玩家最多保留 max_rows 行、max_days 天，
+    玩家文件数超过 max_players 时删除最久未更新的
+    """
+
+    def __init__(self, path: Path, max_rows: int, max_days: float, max_players: int) -> None:
+        self.path = path
+        self.max_rows = max_rows
+        self.max_days = max_days
+        self.max_players = max_players
+        self._lock: Optional[asyncio.Lock] = None
+        self._created = 0
+
+    def file(self, user_id: str) -> Path:
+        if not SAFE_ID_RE.fullmatch(user_id):
+            user_id = hashlib.blake2b(user_id.encode(), digest_size=16).hexdigest()
+        return self.path / f"{user_id}.bin"
+
+    def load(self, user_id: str) -> Optional[Columns]:
+        try:
+            with open(self.file(user_id), "rb") as f:
+                return decode(f.read())
+        except FileNotFoundError:
+            return None
+        except (ValueError, IndexError, struct.error) as e:
+            logger.warning("历史数据文件损坏 %s: %r" % (user_id, e))
+            return None
+
+    def append(self, user_id: str, row: Tuple[int, ...]) -> bool:
+        """追加一行快照，新建了文件时返回 True"""
+        columns = self.load(user_id)
+        created = columns is None
+        if columns is None:
+            columns = {name: array("q") for name in COLUMNS}
+        elif len(columns["time"]) and all(columns[c][-1] == v for c, v in zip(COLUMNS[1:], row[1:])):
+            return False
+        for name, value in zip(COLUMNS, row):
+            columns[name].append(value)
+        times = columns["time"]
+        drop = max(len(times) - self.max_rows, bisect_left(times, row[0] - self.max_days * 86400))
+        if drop > 0:
+            columns = {name: col[drop:] for name, col in columns.items()}
+        file = self.file(user_id)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = file.with_name(file.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(encode(columns))
+        os.replace(tmp, file)
+        return created
+
+    def _evict(self) -> None:
+        files = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".bin"):
+                try:
+                    files.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+        files.sort()
+        for _, path in files[: max(0, len(files) - self.max_players)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    async def _record(self, user_id: str, row: Tuple[int, ...]) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        loop = asyncio.get_event_loop()
+        async with self._lock:
+            try:
+                created = await loop.run_in_executor(None, self.append, user_id, row)
+                if created:
+                    self._created += 1
+                    # 新建的文件累计到一定数量时再检查总数
+                    if self._created % 64 == 0:
+                        await loop.run_in_executor(None, self._evict)
+            except OSError as e:
+                logger.warning("写入历史数据失败 %s: %r" % (user_id, e))
+
+    def record(self, player: Player) -> None:
+        """在后台记录一次查询得到的快照"""
+        if self.max_rows <= 0 or not player.user_id:
+            return
+        asyncio.ensure_future(self._record(player.user_id, snapshot(player)))
+
+
+history = HistoryStore(
+    Path("cache") / "history",
+    plugin_config.r6s_history_max_rows,
+    plugin_config.r6s_history_max_days,
+    plugin_config.r6s_history_max_players,
+)
@@ -0,0 +1,80 @@
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from .binding import BindingStore
+from .config import plugin_config
+
+
+def normalize_username(username: str) -> str:
+    return username.strip().lower()
+
+
+class IdIndex(BindingStore):
+    """昵称到 ubisoft_id 的索引，昵称不区分大小写，条目超过 ttl 秒后失效
+
+    每个条目为 [ubisoft_id, 昵称原文, 更新时间]，同时维护 ubisoft_id 到最近一次见到的昵称的反查，
+    玩家改名后仍能通过旧昵称找到 id 和新昵称。持久化方式与 BindingStore 相同
+    """
+
+    def __init__(self, path: Path, ttl: float, maxsize: int, flush_delay: float) -> None:
+        super().__init__(path, flush_delay)
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._by_id: Dict[str, str] = {}
+
+    def load(self) -> None:
+        if self._loaded:
+            return
+        super().load()
+        now = time.time()
+        self._data = {k: v for k, v in self._data.items() if now - v[2] < self.ttl}
+        for key, (ubi_id, _, _) in sorted(self._data.items(), key=lambda kv: kv[1][2]):
+            self._by_id[ubi_id] = key
+
+    def _entry(self, key: str) -> Optional[list]:
+        entry = self.get(key)
+        if entry is None or time.time() - entry[2] >= self.ttl:
+            return None
+        return entry
+
+    def get_id(self, username: str) -> Optional[str]:
+        entry = self._entry(normalize_username(username))
+        return None if entry is None else entry[0]
+
+    def get_name(self, ubi_id: str) -> Optional[str]:
+        """ubisoft_id 最近一次对应的昵称"""
+        self.load()
+        key = self._by_id.get(ubi_id)
+        entry = None if key is None else self._entry(key)
+        return None if entry is None else entry[1]
+
+    def add(self, username: str, ubi_id: str) -> None:
+        if not username or not ubi_id:
+            return
+        key = normalize_username(username)
+        entry = self._entry(key)
+        now = time.time()
+        # 映射没变且不久前刚更新过时不重复写盘
+        if entry is not None and entry[0] == ubi_id and now - entry[2] < self.ttl / 2:
+            self._by_id[ubi_id] = key
+            return
+        self.set(key, [ubi_id, username.strip(), now])
+        self._by_id[ubi_id] = key
+        if len(self._data) > self.maxsize:
+            self._evict()
+
+    def _evict(self) -> None:
+        ordered = sorted(self._data.items(), key=lambda kv: kv[1][2])
+        for key, (ubi_id, _, _) in ordered[: len(ordered) - self.maxsize * 9 // 10]:
+            del self._data[key]
+            if self._by_id.get(ubi_id) == key:
+                del self._by_id[ubi_id]
+
+
+id_index = IdIndex(
+    Path("cache") / "r6s_ids.json",
+    plugin_config.r6s_id_index_ttl,
+    plugin_config.r6s_id_index_size,
+    plugin_config.r6s_binding_flush_delay,
+)
@@ -1,21 +1,28 @@
 from .player import Player, CRStat, rank, OperatorStat, SeasonRanks
+from .assets import AVATAR_SIZE, IMGS_PATH, OPERATOR_SIZE, RANK_SIZE, Sprite, fonts, sprites
+from .avatar import avatar_cache
+from .render import render_pool
+from .cache import BlobCache
+from .config import EncodeOptions, plugin_config
+from .metrics import metrics
+from .sources import MISSING_LABELS
+from .history import Trend
+from nonebot.log import logger
 from PIL import Image, ImageDraw, ImageFont
 from PIL.Image import Image as IMG
-from PIL.ImageDraw import ImageDraw as IMGDraw
 from io import BytesIO
 from pathlib import Path
-# import time
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Tuple, Union
+import math
+import time
+import asyncio
 import base64
+import hashlib
 
 RESOURCE_PATH = Path(__file__).parent
-
-IMGS_PATH = Path(__file__).parent / "imgs"
-GEN_WAN_MIN = ImageFont.truetype(
-    str(Path(__file__).parent / "fonts" / "GenYoMin-M.ttc"), 60
-)
-GEN_WAN_MIN_S = ImageFont.truetype(
-    str(Path(__file__).parent / "fonts" / "GenYoMin-M.ttc"), 40
-)
+# 字号：标题与昵称、正文、注释；字体在首次绘制时才加载
+TITLE_SIZE, TEXT_SIZE, NOTE_SIZE = 60, 40, 24
 
 
 def rank_img_path(rank: int) -> str:
@@ -35,243 +42,822 @@ def paste_with_alpha(image: IMG, img: IMG, pos: tuple) -> None:
     image.paste(img, pos, img_alpha)
 
 
-def encode_b64(img: IMG) -> str:
+def paste_sprite(image: IMG, sprite: Sprite, pos: tuple) -> None:
+    image.paste(sprite.image, pos, sprite.mask)
+
+
+def encode_png(img: IMG) -> bytes:
     img_io = BytesIO()
     img.save(img_io, "PNG")
-    return base64.b64encode(img_io.getvalue()).decode()
+    return img_io.getvalue()
+
+
+def encode_image(img: IMG, options: EncodeOptions) -> bytes:
+    fmt = options.format.lower()
+    if options.flatten or fmt == "jpeg":
+        img = img.convert("RGB")
+    if options.colors > 0 and fmt != "jpeg":
+        # FASTOCTREE 同时支持 RGB 与 RGBA，且远快于默认的 MEDIANCUT
+        img = img.quantize(options.colors, method=2, dither=Image.NONE)
+    img_io = BytesIO()
+    if fmt == "png":
+        img.save(img_io, "PNG", compress_level=options.compress_level)
+    elif fmt == "jpeg":
+        img.save(img_io, "JPEG", quality=options.quality)
+    elif fmt == "webp":
+        img.save(img_io, "WEBP", quality=options.quality)
+    else:
+        raise ValueError("unsupported image format: %s" % options.format)
+    return img_io.getvalue()
+
 
+def encode_options(card: str, group_id: Optional[str] = None) -> EncodeOptions:
+    if group_id is not None and group_id in plugin_config.r6s_encode_groups:
+        return plugin_config.r6s_encode_groups[group_id]
+    return plugin_config.r6s_encode_cards.get(card, plugin_config.r6s_encode)
 
-async def draw_head(img: IMG, player: Player, title: str) -> IMGDraw:
-    avatar_img = None
+
+def render_scale(group_id: Optional[str] = None) -> float:
+    return plugin_config.r6s_render_scale_groups.get(group_id, plugin_config.r6s_render_scale)
+
+
+def encode_b64(img: IMG) -> str:
+    with metrics.span("encode"):
+        return base64.b64encode(encode_png(img)).decode()
+
+
+async def load_avatar(player: Player) -> Optional[IMG]:
     try:
-        avatar_img = await player.get_avatar()
+        with metrics.span("avatar"):
+            return await avatar_cache.get_image(player.user_id)
     except:
-        pass
-    avatar = None
-    if avatar_img is not None:
-        avatar_data = BytesIO(avatar_img)
-        avatar = Image.open(avatar_data).convert("RGBA").resize((110, 110))
-    else:
-        avatar = Image.open(avatar_img_path()).resize((110, 110))
+        return None
 
-    paste_with_alpha(img, avatar, (40, 40))
-    draw = ImageDraw.Draw(img)
-    draw.text((200, 20), player.username, fill="black", font=GEN_WAN_MIN)
-    draw.text((200, 100), title, fill="black", font=GEN_WAN_MIN)
-    return draw
 
+def px(value: float, scale: float) -> int:
+    return int(round(value * scale))
 
-async def base_image(player: Player) -> IMG:
-    image = Image.new("RGBA", (800, 420), color="white")
-    draw = await draw_head(image, player, "基础信息")
 
-    ranked_mmr = "-" if player.ranked_stat is None else player.ranked_stat.mmr
-    ranked_time = (
-        "-" if player.ranked_stat is None else player.ranked_stat.timePlayed // 3600
-    )
+def measure(text: str, size: int, scale: float = 1.0) -> float:
+    """文字宽度，换算为 1 倍时的数值"""
+    return text_length(text, fonts.get(px(size, scale))) / scale
 
-    draw.multiline_text(
-        (20, 190),
-        f"等级: {player.level()}\n"
-        f"总局数: {player.gerneral_stat.played}\n"
-        f"总时长: {player.gerneral_stat.timePlayed / 3600:.2f}\n"
-        f"赛季排位MMR: {str(ranked_mmr).split('.')[0]}",
+
+class Canvas:
+    """按 scale 缩放的画布：坐标、字号和图标尺寸都按 1 倍时的数值传入，由 Canvas 换算为像素"""
+
+    __slots__ = ("image", "draw", "scale")
+
+    def __init__(self, image: IMG, scale: float) -> None:
+        self.image = image
+        self.scale = scale
+        self.draw = ImageDraw.Draw(image)
+
+    @classmethod
+    def new(cls, size: Tuple[int, int], scale: float) -> "Canvas":
+        return cls(Image.new("RGBA", cls.size_of(size, scale), color="white"), scale)
+
+    @staticmethod
+    def size_of(size: Tuple[int, int], scale: float) -> Tuple[int, int]:
+        return px(size[0], scale), px(size[1], scale)
+
+    def copy(self) -> "Canvas":
+        return Canvas(self.image.copy(), self.scale)
+
+    def s(self, value: float) -> float:
+        return value * self.scale
+
+    def size(self, size: Tuple[int, int]) -> Tuple[int, int]:
+        return self.size_of(size, self.scale)
+
+    def font(self, size: int) -> ImageFont.FreeTypeFont:
+        return fonts.get(px(size, self.scale))
+
+    def text(self, xy: tuple, text: str, size: int = TEXT_SIZE, fill: str = "black") -> None:
+        self.draw.text((self.s(xy[0]), self.s(xy[1])), text, fill=fill, font=self.font(size))
+
+    def paste(self, sprite: Sprite, xy: tuple) -> None:
+        paste_sprite(self.image, sprite, (px(xy[0], self.scale), px(xy[1], self.scale)))
+
+    def paste_avatar(self, avatar: Optional[IMG], xy: tuple) -> None:
+        if avatar is None:
+            self.paste(sprites.avatar(self.size(AVATAR_SIZE)), xy)
+            return
+        if self.scale != 1:
+            avatar = avatar.resize(self.size(AVATAR_SIZE))
+        paste_with_alpha(self.image, avatar, (px(xy[0], self.scale), px(xy[1], self.scale)))
+
+
+def draw_head(canvas: Canvas, player: Player, avatar: Optional[IMG]) -> None:
+    draw_name(canvas, player.username, avatar)
+
+
+def draw_name(canvas: Canvas, username: str, avatar: Optional[IMG]) -> None:
+    canvas.paste_avatar(avatar, (40, 40))
+    canvas.text((200, 20), username, TITLE_SIZE)
+
+
+def draw_missing(canvas: Canvas, player: Player, keys: Tuple[str, ...]) -> None:
+    """卡片用到的字段中有数据来源无法提供的，在标题右侧注明来源和缺失的内容"""
+    missing = [MISSING_LABELS[k] for k in keys if k in player.missing]
+    if not missing:
+        return
+    font = canvas.font(NOTE_SIZE)
+    for i, text in enumerate((f"数据来源: {player.source}", "缺少: " + "、".join(missing))):
+        x = canvas.image.width - canvas.s(20) - text_width(text, font)
+        canvas.draw.text((x, canvas.s(110 + i * 32)), text, fill="gray", font=font)
+
+
+def mmr_text(player: Player, mmr) -> str:
+    return "-" if "mmr" in player.missing else str(mmr).split('.')[0]
+
+
+# 卡片模板：白底、标题、各项标签和分区标题等不随玩家变化的部分只绘制一次，
+# 每次查询在模板的副本上补充头像、昵称和数值。画布按内容计算大小，宽度不小于 CARD_WIDTH
+BASE_LEFT = ("等级: ", "总局数: ", "总时长: ", "赛季排位MMR: ")
+BASE_RIGHT = ("总KD: ", "总胜率: ", "排位时长: ", "赛季非排MMR: ")
+RANK_LEFT = ("赛季MMR: ", "KD:  ", "胜率：")
+RANK_RIGHT = ("局数: ", "时长: ")
+BEST_LEFT = ("历史最高MMR: ", "赛季最终MMR: ", "胜场：")
+BEST_RIGHT = ("", "", "败场: ")
+PLAYS_LEFT = ("胜场: ", "最终MMR: ")
+PLAYS_RIGHT = ("败场: ", "最高MMR: ")
+OPERATOR_LABELS = ("时长: ", "KD: ", "胜率: ")
+OPERATOR_ROWS = 14  # 干员卡片最多显示的干员数
+LINE_SPACING = 20
+CARD_WIDTH = 800
+SECTION_HEIGHT = 200  # 详细信息、历史段位中每一段，干员信息中每一行的高度
+HEAD_HEIGHT = 200  # 头像、昵称和标题
+
+
+@lru_cache(maxsize=None)
+def text_width(text: str, font: ImageFont.FreeTypeFont) -> int:
+    return font.getsize(text)[0]
+
+
+@lru_cache(maxsize=None)
+def text_length(text: str, font: ImageFont.FreeTypeFont) -> float:
+    return font.getlength(text)
+
+
+@lru_cache(maxsize=None)
+def line_height(font: ImageFont.FreeTypeFont, spacing: int = LINE_SPACING) -> int:
+    # 与 ImageDraw.multiline_text 的行距一致
+    return font.getbbox("A")[3] + spacing
+
+
+def column_width(x: int, labels: Tuple[str, ...], sample: str, scale: float) -> int:
+    """从 x 开始的一列标签加上形如 sample 的数值所需的画布宽度"""
+    widest = max(measure(label + sample, TEXT_SIZE, scale) for label in labels if label)
+    return max(CARD_WIDTH, int(x + widest + 20))
+
+
+def draw_labels(canvas: Canvas, xy: tuple, labels: Tuple[str, ...]) -> None:
+    canvas.draw.multiline_text(
+        (canvas.s(xy[0]), canvas.s(xy[1])),
+        "\n".join(labels),
         fill="black",
-        font=GEN_WAN_MIN_S,
-        spacing=20,
+        font=canvas.font(TEXT_SIZE),
+        spacing=px(LINE_SPACING, canvas.scale),
     )
-    draw.multiline_text(
-        (415, 190),
-        f"总KD: {player.gerneral_stat.kd()}\n"
-        f"总胜率: {player.gerneral_stat.win_rate()}\n"
-        f"排位时长: {ranked_time}\n"
-        f"赛季非排MMR: {str(player.casual_stat.mmr).split('.')[0]}",
+
+
+def draw_values(canvas: Canvas, xy: tuple, labels: Tuple[str, ...], values: tuple) -> None:
+    font = canvas.font(TEXT_SIZE)
+    x, y = canvas.s(xy[0]), canvas.s(xy[1])
+    step = line_height(font, px(LINE_SPACING, canvas.scale))
+    for i, (label, value) in enumerate(zip(labels, values)):
+        if label:
+            canvas.draw.text(
+                (x + text_length(label, font), y + i * step),
+                str(value),
+                fill="black",
+                font=font,
+            )
+
+
+def draw_centered(canvas: Canvas, y: int, text: str) -> None:
+    font = canvas.font(TEXT_SIZE)
+    canvas.draw.text(
+        (canvas.image.width // 2 - text_width(text, font) // 2, canvas.s(y)),
+        text,
         fill="black",
-        font=GEN_WAN_MIN_S,
-        spacing=20,
+        font=font,
     )
 
-    return image
 
+def new_template(size: tuple, title: str, scale: float) -> Canvas:
+    canvas = Canvas.new(size, scale)
+    canvas.text((200, 100), title, TITLE_SIZE)
+    return canvas
 
-async def detail_image(player: Player) -> IMG:
-    def draw_rank(
-            img: IMG, draw: IMGDraw, stat: CRStat, offset: int, has_rank: bool = False
-    ):
-        ranked_rank = (
-            Image.open(rank_img_path(rank(stat.mmr))).resize((150, 150))
-            if not has_rank
-            else Image.open(
-                rank_img_path(rank(player.history_max_mmr_season["max_mmr"]))
-            ).resize((150, 150))
-        )
-        paste_with_alpha(img, ranked_rank, (20, offset + 20))
-        # draw.rounded_rectangle(
-        #     [10, offset + 10, 790, offset + 190], radius=5, outline='black', width=2)
+
+@lru_cache(maxsize=None)
+def base_template(scale: float) -> Canvas:
+    canvas = new_template((CARD_WIDTH, 420), "基础信息", scale)
+    draw_labels(canvas, (20, 190), BASE_LEFT)
+    draw_labels(canvas, (415, 190), BASE_RIGHT)
+    return canvas
+
+
+def render_base(player: Player, avatar: Optional[IMG], scale: float = 1.0) -> IMG:
+    canvas = base_template(scale).copy()
+    draw_head(canvas, player, avatar)
+
+    ranked_mmr = "-" if player.ranked_stat is None else mmr_text(player, player.ranked_stat.mmr)
+    ranked_time = (
+        "-" if player.ranked_stat is None else player.ranked_stat.timePlayed // 3600
+    )
+
+    draw_values(
+        canvas,
+        (20, 190),
+        BASE_LEFT,
+        (
+            player.level(),
+            player.gerneral_stat.played,
+            f"{player.gerneral_stat.timePlayed / 3600:.2f}",
+            ranked_mmr,
+        ),
+    )
+    draw_values(
+        canvas,
+        (415, 190),
+        BASE_RIGHT,
+        (
+            player.gerneral_stat.kd(),
+            player.gerneral_stat.win_rate(),
+            ranked_time,
+            mmr_text(player, player.casual_stat.mmr),
+        ),
+    )
+    draw_missing(canvas, player, ("mmr",))
+
+    return canvas.image
+
+
+@lru_cache(maxsize=None)
+def detail_template(has_ranked: bool, scale: float) -> Canvas:
+    # 非排、（排位、）最高段位各占 250，最后一段只有标签没有下方间距
+    sections = 3 if has_ranked else 2
+    width = column_width(510, RANK_RIGHT + BEST_RIGHT, "00000.00", scale)
+    canvas = new_template((width, 190 + sections * 250), "详细信息", scale)
+    draw_centered(canvas, 190, "— 非排数据 —")
+    offsets = [240]
+    if has_ranked:
+        draw_centered(canvas, 440, "— 排位数据 —")
+        offsets.append(490)
+    for offset in offsets:
+        draw_labels(canvas, (190, offset + 20), RANK_LEFT)
+        draw_labels(canvas, (510, offset + 20), RANK_RIGHT)
+    draw_centered(canvas, 690 if has_ranked else 440, "- 最高段位数据 -")
+    offset = 740 if has_ranked else 490
+    draw_labels(canvas, (190, offset + 20), BEST_LEFT)
+    draw_labels(canvas, (510, offset + 20), BEST_RIGHT)
+    return canvas
+
+
+def render_detail(player: Player, avatar: Optional[IMG], scale: float = 1.0) -> IMG:
+    def draw_rank(canvas: Canvas, stat: CRStat, offset: int, has_rank: bool = False):
+        season = player.history_max_mmr_season
+        ranked_rank = rank(stat.mmr) if not has_rank else rank(season.get("max_mmr", 0))
+        canvas.paste(sprites.rank(ranked_rank, canvas.size(RANK_SIZE)), (20, offset + 20))
         if not has_rank:
-            draw.multiline_text(
+            draw_values(
+                canvas,
                 (190, offset + 20),
-                f"赛季MMR: {str(stat.mmr).split('.')[0]}\n"
-                f"KD:  {stat.kd()}\n"
-                f"胜率：{stat.win_rate()}",
-                fill="black",
-                font=GEN_WAN_MIN_S,
-                spacing=20,
+                RANK_LEFT,
+                (mmr_text(player, stat.mmr), stat.kd(), stat.win_rate()),
             )
-            draw.multiline_text(
+            draw_values(
+                canvas,
                 (510, offset + 20),
-                f"局数: {stat.played}\n" + f"时长: {stat.timePlayed / 3600:.2f}",
-                # + (f"\n历史最高MMR: {int(player.history_max_mmr)}" if has_rank else ""),
-                fill="black",
-                font=GEN_WAN_MIN_S,
-                spacing=20,
+                RANK_RIGHT,
+                (stat.played, f"{stat.timePlayed / 3600:.2f}"),
             )
+        elif not season:
+            # 没有赛季数据（新玩家或数据来源不提供）
+            draw_values(canvas, (190, offset + 20), BEST_LEFT, ("-", "-", "-"))
+            draw_values(canvas, (510, offset + 20), BEST_RIGHT, ("", "", "-"))
         else:
-            draw.multiline_text(
+            draw_values(
+                canvas,
                 (190, offset + 20),
-                f"历史最高MMR: {str(player.history_max_mmr_season['max_mmr']).split('.')[0]}\n"
-                f"赛季最终MMR: {str(player.history_max_mmr_season['mmr']).split('.')[0]}\n"
-                f"胜场：{player.history_max_mmr_season['wins']}",
-                fill="black",
-                font=GEN_WAN_MIN_S,
-                spacing=20,
-            )
-            draw.multiline_text(
-                (510, offset + 20),
-                f"\n\n" + f"败场: {player.history_max_mmr_season['losses']}",
-                fill="black",
-                font=GEN_WAN_MIN_S,
-                spacing=20,
+                BEST_LEFT,
+                (
+                    str(season['max_mmr']).split('.')[0],
+                    str(season['mmr']).split('.')[0],
+                    season['wins'],
+                ),
             )
+            draw_values(canvas, (510, offset + 20), BEST_RIGHT, ("", "", season['losses']))
 
-    image = Image.new("RGBA", (900, 940 if player.ranked_stat else 440), color="white")
-    draw = await draw_head(image, player, "详细信息")
-    str_len = GEN_WAN_MIN_S.getsize("— 非排数据 —")[0]
-    draw.text((400 - str_len // 2, 190), "— 非排数据 —", fill="black", font=GEN_WAN_MIN_S)
-    draw_rank(image, draw, player.casual_stat, 240)
+    canvas = detail_template(player.ranked_stat is not None, scale).copy()
+    draw_head(canvas, player, avatar)
+    draw_rank(canvas, player.casual_stat, 240)
     if player.ranked_stat is not None:
-        str_len = GEN_WAN_MIN_S.getsize("— 排位数据 —")[0]
-        draw.text(
-            (400 - str_len // 2, 440), "— 排位数据 —", fill="black", font=GEN_WAN_MIN_S
-        )
-        draw_rank(image, draw, player.ranked_stat, 490)
-    str_len = GEN_WAN_MIN_S.getsize("- 最高段位数据 -")[0]
-    draw.text(
-        (400 - str_len // 2, 690 if player.ranked_stat is not None else 440),
-        "- 最高段位数据 -",
-        fill="black",
-        font=GEN_WAN_MIN_S,
-    )
+        draw_rank(canvas, player.ranked_stat, 490)
     draw_rank(
-        image,
-        draw,
+        canvas,
         player.ranked_stat,
-        740 if player.ranked_stat is not None else 540,
+        740 if player.ranked_stat is not None else 490,
         True,
     )
+    draw_missing(canvas, player, ("mmr", "SeasonRanks"))
 
-    return image
+    return canvas.image
 
 
-async def plays_image(player: Player) -> IMG:
+@lru_cache(maxsize=64)
+def plays_template(seasons: int, scale: float) -> Canvas:
+    width = column_width(495, PLAYS_RIGHT, "00000", scale)
+    canvas = new_template((width, HEAD_HEIGHT + seasons * SECTION_HEIGHT), "历史段位", scale)
+    for i in range(seasons):
+        offset = 190 + i * SECTION_HEIGHT
+        draw_labels(canvas, (190, offset + 70), PLAYS_LEFT)
+        draw_labels(canvas, (495, offset + 70), PLAYS_RIGHT)
+    return canvas
+
+
+def render_plays(player: Player, avatar: Optional[IMG], scale: float = 1.0) -> IMG:
     """
     暂时不需要近期对战了
     :param player:
     :return:
     """
 
-    # def draw_play(draw: IMGDraw, stat: CRStat, offset: int):
-    #     timestr = time.strftime(
-    #         "%Y-%m-%d %H:%M", time.localtime(stat.time/1000))
-    #     draw.text((20, offset + 20), timestr,
-    #               fill='black', font=GEN_WAN_MIN_S)
-    #     draw.multiline_text(
-    #         (20, offset + 70),
-    #         f"局数: {stat.played}\n"
-    #         f"时长: {stat.timePlayed / 3600:.2f}",
-    #         fill='black', font=GEN_WAN_MIN_S, spacing=20)
-    #     draw.multiline_text(
-    #         (400, offset + 70),
-    #         f"KD: {stat.kd()}\n"
-    #         f"胜率: {stat.win_rate()}",
-    #         fill='black', font=GEN_WAN_MIN_S, spacing=20)
-    #
-    # image = Image.new('RGBA', (800, 900), color='white')
-    # draw = await draw_head(image, player, "近期对战")
-    # for (i, stat) in enumerate(player.recent_stat):
-    #     draw_play(draw, stat, 190 + i * 170)
-    #     if i >= 3:
-    #         break
-    #
-    # return image
-
-    def draw_play(img: IMG, draw: IMGDraw, stat: SeasonRanks, offset: int):
-        ranked_rank = Image.open(rank_img_path(rank(stat.mmr))).resize((150, 150))
-        paste_with_alpha(img, ranked_rank, (20, offset + 20))
-
-        draw.multiline_text(
+    def draw_play(canvas: Canvas, stat: SeasonRanks, offset: int):
+        canvas.paste(sprites.rank(rank(stat.mmr), canvas.size(RANK_SIZE)), (20, offset + 20))
+        draw_values(
+            canvas,
             (190, offset + 70),
-            f"胜场: {stat.wins}\n" f"最终MMR: {str(stat.mmr).split('.')[0]}",
-            fill="black",
-            font=GEN_WAN_MIN_S,
-            spacing=20,
+            PLAYS_LEFT,
+            (stat.wins, str(stat.mmr).split('.')[0]),
         )
-        draw.multiline_text(
+        draw_values(
+            canvas,
             (495, offset + 70),
-            f"败场: {stat.losses}\n" f"最高MMR: {str(stat.max_mmr).split('.')[0]}",
-            fill="black",
-            font=GEN_WAN_MIN_S,
-            spacing=20,
+            PLAYS_RIGHT,
+            (stat.losses, str(stat.max_mmr).split('.')[0]),
         )
 
-    image = Image.new(
-        "RGBA",
-        (
-            990,
-            player.season_rank.__len__() * 240
-            if player.season_rank.__len__() > 3
-            else 700,
-        ),
-        color="white",
-    )
-    draw = await draw_head(image, player, "历史段位")
+    canvas = plays_template(len(player.season_rank), scale).copy()
+    draw_head(canvas, player, avatar)
     for (i, stat) in enumerate(player.season_rank):
-        season = stat.get_season()
-        len_ = GEN_WAN_MIN_S.getsize(f"— {season} —")[0]
+        draw_centered(canvas, SECTION_HEIGHT * (i + 1), f"— {stat.get_season()} —")
+        draw_play(canvas, stat, 190 + i * SECTION_HEIGHT)
+    draw_missing(canvas, player, ("SeasonRanks",))
+
+    return canvas.image
+
+
+@lru_cache(maxsize=None)
+def operators_template(count: int, scale: float) -> Canvas:
+    rows = (count + 1) // 2
+    canvas = new_template((CARD_WIDTH, HEAD_HEIGHT + rows * SECTION_HEIGHT), "干员信息", scale)
+    for i in range(count):
+        second = i % 2 == 1
+        draw_labels(canvas, (570 if second else 190, 190 + i // 2 * SECTION_HEIGHT + 20), OPERATOR_LABELS)
+    return canvas
+
+
+def render_operators(player: Player, avatar: Optional[IMG], scale: float = 1.0) -> IMG:
+    def draw_operator(canvas: Canvas, operator: OperatorStat, offset: int, second: bool):
+        sprite = sprites.operator(operator.name, canvas.size(OPERATOR_SIZE))
+        canvas.paste(sprite, (400 if second else 10, offset + 10))
+        draw_values(
+            canvas,
+            (570 if second else 190, offset + 20),
+            OPERATOR_LABELS,
+            (f"{operator.timePlayed / 3600:.1f}", operator.kd(), operator.win_rate()),
+        )
+
+    operators = player.operator_stat[:OPERATOR_ROWS]
+    canvas = operators_template(len(operators), scale).copy()
+    draw_head(canvas, player, avatar)
+    for (i, operator) in enumerate(operators):
+        draw_operator(canvas, operator, 190 + i // 2 * SECTION_HEIGHT, i % 2 == 1)
+    draw_missing(canvas, player, ("StatOperator",))
+
+    return canvas.image
+
+
+COMPARE_LABELS = ("等级", "总KD", "总胜率", "非排MMR", "排位MMR", "排位KD")
+COMPARE_ERRORS = {"Not Found": "未找到", "Error": "查询出错"}
+COMPARE_COLUMN = 280
+
+
+def fit_text(text: str, width: float, font: ImageFont.FreeTypeFont) -> str:
+    if font.getsize(text)[0] <= width:
+        return text
+    while text and font.getsize(text + "…")[0] > width:
+        text = text[:-1]
+    return text + "…"
+
+
+@lru_cache(maxsize=16)
+def compare_template(count: int, scale: float) -> Canvas:
+    canvas = Canvas.new((240 + count * COMPARE_COLUMN + 20, 780), scale)
+    draw_labels(canvas, (20, 220), COMPARE_LABELS)
+    canvas.text((20, 655), "段位")
+    return canvas
+
+
+def render_compare(
+    players: List[Union[Player, str]],
+    names: List[str],
+    avatars: List[Optional[IMG]],
+    scale: float = 1.0,
+) -> IMG:
+    """多名玩家的对比卡片，查询失败的玩家在对应列中标注原因"""
+    canvas = compare_template(len(players), scale).copy()
+    font = canvas.font(TEXT_SIZE)
+    step = line_height(font, px(LINE_SPACING, scale))
+    column = canvas.s(COMPARE_COLUMN)
+
+    def draw_cell(x: int, y: float, text: str) -> None:
+        text = fit_text(str(text), column - canvas.s(20), font)
+        width = font.getsize(text)[0]
+        canvas.draw.text((canvas.s(x) + (column - width) // 2, y), text, fill="black", font=font)
+
+    for i, (player, name, avatar) in enumerate(zip(players, names, avatars)):
+        x = 240 + i * COMPARE_COLUMN
+        avatar_pos = (x + (COMPARE_COLUMN - 110) // 2, 30)
+        if not isinstance(player, Player):
+            canvas.paste_avatar(None, avatar_pos)
+            draw_cell(x, canvas.s(150), name)
+            draw_cell(x, canvas.s(220), COMPARE_ERRORS.get(player, "查询出错"))
+            continue
+        canvas.paste_avatar(avatar, avatar_pos)
+        draw_cell(x, canvas.s(150), player.username)
+        ranked = player.ranked_stat
+        values = (
+            player.level(),
+            player.gerneral_stat.kd(),
+            player.gerneral_stat.win_rate(),
+            mmr_text(player, player.casual_stat.mmr),
+            "-" if ranked is None else mmr_text(player, ranked.mmr),
+            "-" if ranked is None else ranked.kd(),
+        )
+        for row, value in enumerate(values):
+            draw_cell(x, canvas.s(220) + row * step, value)
+        mmr = player.casual_stat.mmr if ranked is None else ranked.mmr
+        canvas.paste(sprites.rank(rank(mmr), canvas.size(RANK_SIZE)), (x + (COMPARE_COLUMN - 150) // 2, 600))
+
+    return canvas.image
+
+
+TREND_LEFT = ("局数: ", "KD: ", "胜率: ")
+TREND_RIGHT = ("时长: ", "非排MMR: ", "排位MMR: ")
+TREND_CHARTS = (("— MMR —", 440), ("— 滚动KD —", 730), ("— 滚动胜率 —", 1020))
+CHART_LEFT, CHART_RIGHT, CHART_HEIGHT = 110, 870, 200
+CASUAL_COLOR, RANKED_COLOR = "#4a90d9", "#d9534f"
+
+
+@lru_cache(maxsize=None)
+def trend_template(days: int, window: int, scale: float) -> Canvas:
+    canvas = new_template((900, 1290), f"近{days}天趋势", scale)
+    draw_labels(canvas, (20, 190), TREND_LEFT)
+    draw_labels(canvas, (460, 190), TREND_RIGHT)
+    for (title, top), suffix in zip(TREND_CHARTS, ("", f"（{window}天）", f"（{window}天）")):
+        draw_centered(canvas, top - 50, title.replace(" —", suffix + " —"))
+    return canvas
+
+
+def draw_chart(
+    canvas: Canvas,
+    top: int,
+    times: List[int],
+    series: List[Tuple[List[Optional[float]], str, str]],
+    fmt: str,
+    unit: float = 1,
+) -> None:
+    """折线图，series 为 (数值, 颜色, 图例)，数值为 None 的点断开不画
+
+    unit 为 fmt 能区分的最小差值，纵轴刻度取 unit 的整数倍，相邻刻度的文字不会相同
+    """
+    draw, s, font = canvas.draw, canvas.s, canvas.font(NOTE_SIZE)
+    box = (s(CHART_LEFT), s(top), s(CHART_RIGHT), s(top + CHART_HEIGHT))
+    draw.rectangle(box, outline="gray")
+    valid = [v for values, _, _ in series for v in values if v is not None]
+    if not valid:
+        text = "暂无数据"
         draw.text(
-            (400 - len_ // 2, 200 * (i + 1)),
-            f"— {season} —",
-            fill="black",
-            font=GEN_WAN_MIN_S,
+            ((box[0] + box[2] - text_width(text, font)) // 2, s(top + CHART_HEIGHT // 2 - 12)),
+            text,
+            fill="gray",
+            font=font,
+        )
+        return
+    lo, hi = math.floor(min(valid) / unit), math.ceil(max(valid) / unit)
+    step = max(1, math.ceil((hi - lo) / 4))
+    # 数值集中时上下留白，折线居中
+    lo -= (step * 4 - (hi - lo)) // 2
+    lo, hi = lo * unit, (lo + step * 4) * unit
+    t0, t1 = times[0], max(times[-1], times[0] + 1)
+
+    def xy(t: int, v: float) -> Tuple[float, float]:
+        return (
+            box[0] + (t - t0) / (t1 - t0) * (box[2] - box[0]),
+            box[3] - (v - lo) / (hi - lo) * (box[3] - box[1]),
         )
-        draw_play(image, draw, stat, 190 + i * 200)
 
-    return image
+    for i in range(5):
+        v = lo + (hi - lo) * i / 4
+        y = xy(t0, v)[1]
+        if 0 < i < 4:
+            draw.line((box[0], y, box[2], y), fill="#e0e0e0")
+        text = fmt.format(v)
+        draw.text((box[0] - s(8) - text_width(text, font), y - s(12)), text, fill="gray", font=font)
+    for t, anchor in ((t0, box[0]), (times[-1], box[2] - text_width("00-00", font))):
+        draw.text((anchor, box[3] + s(6)), time.strftime("%m-%d", time.localtime(t)), fill="gray", font=font)
+
+    legend_x = box[2]
+    width = max(1, px(3, canvas.scale))
+    for values, color, label in reversed(series):
+        if label:
+            legend_x -= text_width(label, font) + s(16)
+            draw.text((legend_x, box[1] - s(30)), label, fill=color, font=font)
+        segment: List[Tuple[float, float]] = []
+        for t, v in list(zip(times, values)) + [(0, None)]:
+            if v is not None:
+                segment.append(xy(t, v))
+                continue
+            if len(segment) > 1:
+                draw.line(segment, fill=color, width=width)
+            elif segment:
+                x, y = segment[0]
+                draw.ellipse((x - width, y - width, x + width, y + width), fill=color)
+            segment = []
+
+
+def render_trend(
+    username: str, trend: Trend, avatar: Optional[IMG], days: int, window: int, scale: float = 1.0
+) -> IMG:
+    canvas = trend_template(days, window, scale).copy()
+    draw_name(canvas, username, avatar)
+    delta = trend.delta
+
+    def mmr_change(values: List[int]) -> str:
+        values = [v for v in values if v]
+        if not values:
+            return "-"
+        return f"{values[-1]} ({values[-1] - values[0]:+d})"
+
+    draw_values(
+        canvas,
+        (20, 190),
+        TREND_LEFT,
+        (
+            f"+{delta['played']}",
+            f"{delta['kills'] / delta['deaths']:.2f}" if delta["deaths"] else "-",
+            f"{delta['won'] / delta['played'] * 100:.2f}%" if delta["played"] else "-",
+        ),
+    )
+    draw_values(
+        canvas,
+        (460, 190),
+        TREND_RIGHT,
+        (f"+{delta['time_played'] / 3600:.2f}", mmr_change(trend.casual_mmr), mmr_change(trend.ranked_mmr)),
+    )
+    mmr_top, kd_top, win_top = (top for _, top in TREND_CHARTS)
+    draw_chart(
+        canvas,
+        mmr_top,
+        trend.time,
+        [
+            ([v or None for v in trend.casual_mmr], CASUAL_COLOR, "非排"),
+            ([v or None for v in trend.ranked_mmr], RANKED_COLOR, "排位"),
+        ],
+        "{:.0f}",
+    )
+    draw_chart(canvas, kd_top, trend.time, [(trend.kd, CASUAL_COLOR, "")], "{:.2f}", 0.01)
+    draw_chart(canvas, win_top, trend.time, [(trend.win_rate, CASUAL_COLOR, "")], "{:.0f}%")
+    return canvas.image
+
+
+def _warm_up() -> None:
+    try:
+        sprites.load()
+        for size in (TITLE_SIZE, TEXT_SIZE, NOTE_SIZE):
+            fonts.get(size)
+    except Exception as e:
+        logger.warning("预加载图标和字体失败: %r" % e)
+
+
+async def warm_up() -> None:
+    """在后台线程中预先解码图标、加载字体，不阻塞机器人启动
+
+    进程池模式下等待加载完成，保证随后 fork 出的渲染进程继承已加载的字体和图标，
+    且 fork 时没有其他线程正在加载
+    """
+    future = asyncio.get_event_loop().run_in_executor(None, _warm_up)
+    if render_pool.kind == "process":
+        await future
+
+
+async def base_image(player: Player) -> IMG:
+    return await render_pool.run(render_base, player, await load_avatar(player))
+
+
+async def detail_image(player: Player) -> IMG:
+    return await render_pool.run(render_detail, player, await load_avatar(player))
+
+
+async def plays_image(player: Player) -> IMG:
+    return await render_pool.run(render_plays, player, await load_avatar(player))
 
 
 async def operators_img(player: Player) -> IMG:
-    def draw_operator(
-            img: IMG, draw: IMGDraw, operator: OperatorStat, offset: int, second: bool
-    ):
-        operator_img = Image.open(operator_img_path(operator.name)).resize((170, 170))
-        paste_with_alpha(img, operator_img, (400 if second else 10, offset + 10))
-        draw.multiline_text(
-            (570 if second else 190, offset + 20),
-            f"时长: {operator.timePlayed / 3600:.1f}\n"
-            f"KD: {operator.kd()}\n"
-            f"胜率: {operator.win_rate()}",
-            fill="black",
-            font=GEN_WAN_MIN_S,
-            spacing=20,
-        )
+    return await render_pool.run(render_operators, player, await load_avatar(player))
+
+
+# 卡片缓存：key 由卡片类型和该卡片实际读取的字段决定，卡片布局变化时需增加 CARD_VERSION
+CARD_VERSION = 4
+card_cache = BlobCache(
+    Path("cache") / "cards",
+    plugin_config.r6s_card_cache_memory * 1024 * 1024,
+    plugin_config.r6s_card_cache_disk * 1024 * 1024,
+)
+
+
+def _cr_fields(stat: Optional[CRStat]) -> Optional[tuple]:
+    if stat is None:
+        return None
+    return tuple(
+        getattr(stat, k, None)
+        for k in ("mmr", "kills", "deaths", "won", "played", "timePlayed")
+    )
+
+
+def base_fields(player: Player) -> tuple:
+    general = player.gerneral_stat
+    return (
+        player.username,
+        player.level(),
+        (general.played, general.timePlayed, general.kills, general.deaths, general.won),
+        _cr_fields(player.casual_stat),
+        _cr_fields(player.ranked_stat),
+    )
+
+
+def detail_fields(player: Player) -> tuple:
+    season = player.history_max_mmr_season
+    return (
+        player.username,
+        _cr_fields(player.casual_stat),
+        _cr_fields(player.ranked_stat),
+        tuple(season.get(k) for k in ("max_mmr", "mmr", "wins", "losses")),
+    )
+
+
+def plays_fields(player: Player) -> tuple:
+    return (
+        player.username,
+        tuple((s.season, s.mmr, s.max_mmr, s.wins, s.losses) for s in player.season_rank),
+    )
+
+
+def operators_fields(player: Player) -> tuple:
+    return (
+        player.username,
+        tuple(
+            (o.name, o.timePlayed, o.kills, o.deaths, o.won, o.played)
+            for o in player.operator_stat[:OPERATOR_ROWS]
+        ),
+    )
+
+
+class Card(NamedTuple):
+    name: str
+    render: object
+    fields: object
+    snapshot: object  # 生成传给渲染任务的精简 Player
+
+
+CARDS = {
+    base_image: Card("base", render_base, base_fields, lambda p: p.snapshot()),
+    detail_image: Card("detail", render_detail, detail_fields, lambda p: p.snapshot(best_season=True)),
+    plays_image: Card("plays", render_plays, plays_fields, lambda p: p.snapshot(seasons=True)),
+    operators_img: Card(
+        "operators", render_operators, operators_fields, lambda p: p.snapshot(operators=OPERATOR_ROWS)
+    ),
+}
+
+
+def card_key(
+    card: Card, player: Player, avatar: Optional[IMG], options: EncodeOptions, scale: float = 1.0
+) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{card.name}:{CARD_VERSION}:{scale}:{fonts.path}:{options.json()}:".encode())
+    h.update(repr((card.fields(player), player.source, player.missing)).encode())
+    if avatar is not None:
+        h.update(avatar.tobytes())
+    return h.hexdigest()
+
+
+def _render_encoded(
+    render, player: Player, avatar: Optional[IMG], options: EncodeOptions, scale: float
+) -> Tuple[bytes, float, float]:
+    """返回编码结果及绘制、编码各自的耗时，进程池模式下耗时随结果传回主进程"""
+    start = time.perf_counter()
+    img = render(player, avatar, scale)
+    rendered = time.perf_counter()
+    return encode_image(img, options), rendered - start, time.perf_counter() - rendered
+
+
+def _observe_render(card: str, render_time: float, encode_time: float) -> None:
+    metrics.observe("r6s_stage_seconds", render_time, stage="render", card=card)
+    metrics.observe("r6s_stage_seconds", encode_time, stage="encode", card=card)
 
-    img = Image.new("RGBA", (800, 1600), color="white")
-    draw = await draw_head(img, player, "干员信息")
-    for (i, operator) in enumerate(player.operator_stat):
-        draw_operator(
-            img, draw, operator, 190 + i // 2 * 200, False if i % 2 == 0 else True
+
+async def render_card(func, player: Player, group_id: Optional[str] = None) -> bytes:
+    """绘制并编码卡片，玩家数据未变化时直接返回缓存的编码结果
+
+    在渲染池中一次完成绘图和编码，进程池模式下只需传回编码后的数据
+    """
+    card = CARDS[func]
+    options = encode_options(card.name, group_id)
+    scale = render_scale(group_id)
+    avatar = await load_avatar(player)
+    key = card_key(card, player, avatar, options, scale)
+    data = await card_cache.get(key)
+    if data is None:
+        data, render_time, encode_time = await render_pool.run(
+            _render_encoded, card.render, card.snapshot(player), avatar, options, scale
         )
-        if i >= 13:
-            break
+        _observe_render(card.name, render_time, encode_time)
+        await card_cache.set(key, data)
+    return data
+
+
+async def render_compare_card(
+    players: List[Union[Player, str]], names: List[str], group_id: Optional[str] = None
+) -> bytes:
+    avatars = await asyncio.gather(
+        *(load_avatar(p) if isinstance(p, Player) else _no_avatar() for p in players)
+    )
+    data, render_time, encode_time = await render_pool.run(
+        _render_compare_encoded,
+        [p.snapshot() if isinstance(p, Player) else p for p in players],
+        names,
+        list(avatars),
+        encode_options("compare", group_id),
+        render_scale(group_id),
+    )
+    _observe_render("compare", render_time, encode_time)
+    return data
+
 
-    return img
+async def render_trend_card(
+    username: str, user_id: str, trend: Trend, days: int, window: int, group_id: Optional[str] = None
+) -> bytes:
+    try:
+        with metrics.span("avatar"):
+            avatar = await avatar_cache.get_image(user_id)
+    except Exception:
+        avatar = None
+    data, render_time, encode_time = await render_pool.run(
+        _render_trend_encoded,
+        username,
+        trend,
+        avatar,
+        days,
+        window,
+        encode_options("trend", group_id),
+        render_scale(group_id),
+    )
+    _observe_render("trend", render_time, encode_time)
+    return data
+
+
+def _render_trend_encoded(
+    username: str,
+    trend: Trend,
+    avatar: Optional[IMG],
+    days: int,
+    window: int,
+    options: EncodeOptions,
+    scale: float,
+) -> Tuple[bytes, float, float]:
+    start = time.perf_counter()
+    img = render_trend(username, trend, avatar, days, window, scale)
+    rendered = time.perf_counter()
+    return encode_image(img, options), rendered - start, time.perf_counter() - rendered
+
+
+async def _no_avatar() -> None:
+    return None
+
+
+def _render_compare_encoded(
+    players: List[Union[Player, str]],
+    names: List[str],
+    avatars: List[Optional[IMG]],
+    options: EncodeOptions,
+    scale: float,
+) -> Tuple[bytes, float, float]:
+    start = time.perf_counter()
+    img = render_compare(players, names, avatars, scale)
+    rendered = time.perf_counter()
+    return encode_image(img, options), rendered - start, time.perf_counter() - rendered
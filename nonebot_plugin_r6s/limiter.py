@@ -0,0 +1,157 @@
+import asyncio
+import time
+from collections import Counter
+from typing import Optional
+
+from .cache import TTLCache
+from .config import plugin_config
+
+MESSAGES = {
+    "user": "查询太频繁了，请 %d 秒后再试",
+    "group": "本群查询太频繁了，请 %d 秒后再试",
+    "busy": "当前查询的人太多了，请稍后再试",
+}
+
+
+class RateLimited(Exception):
+    def __init__(self, reason: str, retry_after: float = 0) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def message(self) -> str:
+        msg = MESSAGES[self.reason]
+        return msg % max(1, round(self.retry_after)) if "%d" in msg else msg
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, cost: float) -> float:
+        """补充令牌后返回还需等待的秒数，0 表示可以立即通过"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        cost = min(cost, self.capacity)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def take(self, cost: float) -> None:
+        self.tokens -= min(cost, self.capacity)
+
+
+class Limiter:
+    """查询指令的准入控制：按用户、按群的令牌桶，加上全局并发上限与有界的等待队列
+
+    rate 为 0 时不做对应的限流，concurrency 为 0 时不限并发；
+    等待队列已满或排队超时的查询直接拒绝，不会在后台堆积协程
+    """
+
+    def __init__(
+        self,
+        user_rate: float,
+        user_burst: int,
+        group_rate: float,
+        group_burst: int,
+        concurrency: int,
+        queue_size: int,
+        queue_timeout: float,
+        max_keys: int = 4096,
+    ) -> None:
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        # 桶在 burst / rate 秒内没有使用就已经补满，过期后重新创建即可
+        self._users = TTLCache(max_keys, user_burst / user_rate if user_rate > 0 else 0)
+        self._groups = TTLCache(max_keys, group_burst / group_rate if group_rate > 0 else 0)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.active = 0
+        self.waiting = 0
+        self.outcomes: Counter = Counter()
+
+    @staticmethod
+    def _bucket(cache: TTLCache, key: str, rate: float, burst: int) -> TokenBucket:
+        bucket = cache.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate, burst)
+        cache.set(key, bucket)
+        return bucket
+
+    def check(self, user_id: str, group_id: Optional[str], cost: float = 1) -> None:
+        """两个桶都有足够令牌时才一起扣除，被群限流时不消耗用户的令牌"""
+        buckets = []
+        if self.user_rate > 0:
+            bucket = self._bucket(self._users, user_id, self.user_rate, self.user_burst)
+            wait = bucket.wait_time(cost)
+            if wait:
+                self.outcomes["rejected_user"] += 1
+                raise RateLimited("user", wait)
+            buckets.append(bucket)
+        if self.group_rate > 0 and group_id is not None:
+            bucket = self._bucket(self._groups, group_id, self.group_rate, self.group_burst)
+            wait = bucket.wait_time(cost)
+            if wait:
+                self.outcomes["rejected_group"] += 1
+                raise RateLimited("group", wait)
+            buckets.append(bucket)
+        for bucket in buckets:
+            bucket.take(cost)
+
+    async def acquire(self, user_id: str, group_id: Optional[str], cost: float = 1) -> None:
+        """通过限流并拿到执行名额后返回，否则抛出 RateLimited；成功后须调用 release"""
+        self.check(user_id, group_id, cost)
+        if self.concurrency <= 0:
+            self.active += 1
+            self.outcomes["admitted"] += 1
+            return
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        if not self._slots.locked():
+            await self._slots.acquire()
+            self.active += 1
+            self.outcomes["admitted"] += 1
+            return
+        if self.waiting >= self.queue_size:
+            self.outcomes["rejected_busy"] += 1
+            raise RateLimited("busy")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.outcomes["rejected_timeout"] += 1
+            raise RateLimited("busy")
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self.outcomes["queued"] += 1
+
+    def release(self) -> None:
+        self.active -= 1
+        if self._slots is not None and self.concurrency > 0:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {"active": self.active, "waiting": self.waiting, **self.outcomes}
+
+
+limiter = Limiter(
+    plugin_config.r6s_limit_user_rate,
+    plugin_config.r6s_limit_user_burst,
+    plugin_config.r6s_limit_group_rate,
+    plugin_config.r6s_limit_group_burst,
+    plugin_config.r6s_limit_concurrency,
+    plugin_config.r6s_limit_queue,
+    plugin_config.r6s_limit_queue_timeout,
+)
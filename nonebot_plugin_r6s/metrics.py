@@ -0,0 +1,231 @@
+import asyncio
+import bisect
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from nonebot.exception import FinishedException
+from nonebot.log import logger
+
+from .config import plugin_config
+
+Labels = Tuple[Tuple[str, str], ...]
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in items)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """按桶上界估计分位数"""
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Span:
+    __slots__ = ("metrics", "stage", "labels", "start")
+
+    def __init__(self, metrics: "Metrics", stage: str, labels: Dict[str, object]) -> None:
+        self.metrics = metrics
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.metrics.observe("r6s_stage_seconds", time.perf_counter() - self.start, stage=self.stage, **self.labels)
+        if exc_type is not None and not issubclass(exc_type, (asyncio.CancelledError, FinishedException)):
+            self.metrics.inc("r6s_errors_total", stage=self.stage, error=exc_type.__name__)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Metrics:
+    """进程内的计数器与延迟直方图，关闭时 span / inc / observe 都直接返回
+
+    r6s_stage_seconds 记录各阶段耗时，r6s_errors_total 按阶段和异常类型计数，
+    缓存与渲染池的统计在导出时通过 collector 读取，不在热路径上计数
+    """
+
+    def __init__(self, enabled: bool) -> None:
+        self.enabled = enabled
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.collectors: List[Callable[[], Dict[Tuple[str, Labels], float]]] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._log_task: Optional[asyncio.Task] = None
+
+    def span(self, stage: str, **labels):
+        if not self.enabled:
+            return _NOOP
+        return Span(self, stage, labels)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = Histogram()
+        hist.observe(value)
+
+    def collector(self, func: Callable[[], Dict[Tuple[str, Labels], float]]) -> None:
+        self.collectors.append(func)
+
+    def _collected(self) -> Dict[Tuple[str, Labels], float]:
+        values = dict(self.counters)
+        for func in self.collectors:
+            try:
+                values.update(func())
+            except Exception as e:
+                logger.warning("r6s 指标收集失败: %r" % e)
+        return values
+
+    def prometheus(self) -> str:
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(self._collected().items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append("# TYPE %s %s" % (name, "counter" if name.endswith("_total") else "gauge"))
+            lines.append("%s%s %s" % (name, _format_labels(labels), value))
+        for (name, labels), hist in sorted(self.histograms.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append("# TYPE %s histogram" % name)
+            cumulative = 0
+            for bound, n in zip(BUCKETS + (float("inf"),), hist.counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append("%s_bucket%s %d" % (name, _format_labels(labels, ("le", le)), cumulative))
+            lines.append("%s_sum%s %s" % (name, _format_labels(labels), hist.sum))
+            lines.append("%s_count%s %d" % (name, _format_labels(labels), hist.count))
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        lines = []
+        for (name, labels), hist in sorted(self.histograms.items()):
+            if not hist.count:
+                continue
+            lines.append(
+                "%s%s n=%d avg=%.0fms p50<=%.0fms p95<=%.0fms"
+                % (
+                    name,
+                    _format_labels(labels),
+                    hist.count,
+                    hist.sum / hist.count * 1000,
+                    hist.quantile(0.5) * 1000,
+                    hist.quantile(0.95) * 1000,
+                )
+            )
+        for (name, labels), value in sorted(self._collected().items()):
+            lines.append("%s%s %g" % (name, _format_labels(labels), value))
+        return "\n".join(lines)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            if request.split(b" ")[1:2] == [b"/metrics"]:
+                body, status = self.prometheus().encode(), "200 OK"
+            else:
+                body, status = b"", "404 Not Found"
+            writer.write(
+                b"HTTP/1.1 %s\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: %d\r\nConnection: close\r\n\r\n"
+                % (status.encode(), len(body))
+                + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _log_loop(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            summary = self.summary()
+            if summary:
+                logger.info("r6s 指标汇总\n" + summary)
+
+    async def start(self) -> None:
+        if not self.enabled:
+            return
+        if plugin_config.r6s_metrics_port and self._server is None:
+            self._server = await asyncio.start_server(
+                self._handle, plugin_config.r6s_metrics_host, plugin_config.r6s_metrics_port
+            )
+            logger.info(
+                "r6s 指标地址 http://%s:%d/metrics" % (plugin_config.r6s_metrics_host, plugin_config.r6s_metrics_port)
+            )
+        if plugin_config.r6s_metrics_log_interval > 0 and self._log_task is None:
+            self._log_task = asyncio.ensure_future(self._log_loop(plugin_config.r6s_metrics_log_interval))
+
+    async def stop(self) -> None:
+        if self._log_task is not None:
+            self._log_task.cancel()
+            self._log_task = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+def stats_collector(stats: Callable[[], dict], labels: Dict[str, str], fields: Dict[str, str]):
+    """把 stats() 返回字典中的 fields 导出为指标，fields 为 字段名 -> 指标名，缺少的字段跳过"""
+    key = _labels(labels)
+
+    def collect() -> Dict[Tuple[str, Labels], float]:
+        values = stats()
+        return {(metric, key): values[field] for field, metric in fields.items() if field in values}
+
+    return collect
+
+
+metrics = Metrics(plugin_config.r6s_metrics)
@@ -1,61 +1,145 @@
 import httpx
 import asyncio
-import re
-import json
+from typing import Dict, Optional
 
+from nonebot.log import logger
+
+from .config import plugin_config
+from .metrics import metrics
+from .retry import RetryableError, RetryPolicy
+
+_client: Optional[httpx.AsyncClient] = None
+_host_limits: Dict[str, asyncio.Semaphore] = {}
+
+retry_policy = RetryPolicy(
+    max_attempts=plugin_config.r6s_retry_attempts,
+    base_delay=plugin_config.r6s_retry_base_delay,
+    max_delay=plugin_config.r6s_retry_max_delay,
+    budget=plugin_config.r6s_retry_budget,
+    breaker_threshold=plugin_config.r6s_breaker_threshold,
+    breaker_cooldown=plugin_config.r6s_breaker_cooldown,
+)
+
+
+def _new_client() -> httpx.AsyncClient:
+    http2 = plugin_config.r6s_http2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("未安装 h2，已回退到 HTTP/1.1，可通过 pip install httpx[http2] 启用 HTTP/2")
+            http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=plugin_config.r6s_http_max_connections,
+            max_keepalive_connections=plugin_config.r6s_http_max_keepalive,
+            keepalive_expiry=plugin_config.r6s_http_keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(
+            plugin_config.r6s_http_timeout,
+            connect=plugin_config.r6s_http_connect_timeout,
+        ),
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    """插件共享的长连接客户端，未在启动钩子中创建时按需创建"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _new_client()
+    return _client
+
+
+async def init_client() -> None:
+    get_client()
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def fetch(url: str, **kwargs) -> httpx.Response:
+    """通过共享客户端发起 GET，并按 host 限制并发连接数"""
+    host = httpx.URL(url).host
+    limit = _host_limits.get(host)
+    if limit is None:
+        limit = _host_limits[host] = asyncio.Semaphore(
+            plugin_config.r6s_http_max_connections_per_host
+        )
+    async with limit:
+        return await get_client().get(url, **kwargs)
+
+
+def check_response(response: httpx.Response) -> None:
+    """5xx 与 2xx 的空响应体视为可重试错误，4xx 原样返回由调用方处理（如头像 404）"""
+    if response.status_code >= 500:
+        raise RetryableError("HTTP %d" % response.status_code)
+    if 200 <= response.status_code < 300 and not response.content:
+        raise RetryableError("empty body")
+
+
+async def fetch_retry(url: str, policy: RetryPolicy = retry_policy, **kwargs) -> httpx.Response:
+    async def _get() -> httpx.Response:
+        response = await fetch(url, **kwargs)
+        check_response(response)
+        return response
+
+    return await policy.call(httpx.URL(url).host, _get)
+
+
+async def get_data_from_r6scn(user_name: str) -> dict:
+    base = plugin_config.r6s_r6scn_base
+    url = base + "/Stats?username=" + str(user_name) + '&platform='
+    headers = {
+        'referer': base,
+        'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.116 Safari/537.36',
+        'x-requested-with': 'XMLHttpRequest'
+    }
+
+    async def _get() -> dict:
+        with metrics.span("r6scn_attempt"):
+            response = await fetch(url, headers=headers)
+            check_response(response)
+            try:
+                r = response.json()
+            except ValueError:
+                raise RetryableError("invalid json")
+            if not isinstance(r, dict) or not (r.get("username") or r.get("StatCR")):
+                # r6s.cn 对不存在或未更新的玩家返回空数据，重试用尽后视为未找到
+                raise RetryableError("empty data", host_failure=False)
+            return r
 
-async def get_data_from_r6scn(user_name: str, trytimes=6) -> dict:
-    if trytimes == 0:
-        return ""
     try:
-        base_url = "https://www.r6s.cn/Stats?username="
-        url = base_url + str(user_name) + '&platform='
-        headers = {
-            'Host': 'www.r6s.cn',
-            'referer': 'https://www.r6s.cn',
-            'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.116 Safari/537.36',
-            'x-requested-with': 'XMLHttpRequest'
-        }
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers)
-        if not response.json() and trytimes == 1:
-            return "Not Found"
-        r: dict = response.json()
-        if not (r.get("username") or r.get("StatCR")):
-            trytimes -= 1
-            await asyncio.sleep(0.5)
-            r = await get_data_from_r6scn(user_name, trytimes=trytimes)
-        return r
-    except:
-        trytimes -= 1
-        await asyncio.sleep(0.5)
-        r = await get_data_from_r6scn(user_name, trytimes=trytimes)
+        r = await retry_policy.call(httpx.URL(base).host, _get)
+        metrics.inc("r6s_queries_total", source="r6scn", result="ok")
         return r
+    except RetryableError as e:
+        if not e.host_failure:
+            metrics.inc("r6s_queries_total", source="r6scn", result="not_found")
+            return "Not Found"
+        logger.warning("r6s.cn 查询失败『%s』: %s" % (user_name, e))
+    except Exception as e:
+        logger.warning("r6s.cn 查询失败『%s』: %r" % (user_name, e))
+    metrics.inc("r6s_queries_total", source="r6scn", result="error")
+    return ""
 
 
 async def get_data_from_r6sground(user_name: str) -> dict:
-    async with httpx.AsyncClient() as client:
-        resp = await client.get("https://global.r6sground.cn/stats/%s/data" % user_name)
-    datas = re.split(r"(data: )", resp.text)
-    rdatas = {}
-    for d in datas:
-        if d[:1] != "{":
-            pass
-        else:
-            d = d.replace("!46$", "false")
-            d = d.replace("!47$", "true")
-            d_jdson = json.loads(d)
-            rdatas[d_jdson["key"]] = d_jdson["data"]
-    if not rdatas.get("userMainData"):
-        return "Not Found"
-    elif not rdatas["userMainData"].get("!15$_!6$s:!5$"):
-        return "Not Found"  # 应该是有ubi账号但没打过R6
-    return rdatas
+    from .r6s_ground import check_data, decode
+
+    resp = await fetch("%s/stats/%s/data" % (plugin_config.r6s_ground_base, user_name))
+    return check_data(decode(resp.content))
 
 
 async def get_data_from_r6stats(user_name: str) -> dict:
-    # parse user_name to ubi_id first
-    ubi_id = user_name  # todo
-    async with httpx.AsyncClient() as client:
-        resp = await client.get("https://r6stats.com/api/stats/{ubi_id}?queue=true")
-    # todo
+    from .r6s_stats import lookup_id, trans_data
+
+    ubi_id = await lookup_id(user_name)
+    if not ubi_id:
+        return "Not Found"
+    resp = await fetch_retry(f"{plugin_config.r6s_stats_base}/api/stats/{ubi_id}?queue=true")
+    return trans_data(resp.json())
@@ -1,22 +1,34 @@
-import httpx
-from typing import List, Dict, Optional, Union
+from typing import List, Dict, Optional, Tuple, Union
+
+from .avatar import avatar_cache
+from .metrics import metrics
 
 
 class DataStruct:
+    """只保存 __slots__ 中声明的字段，上游数据中缺失的字段保持未赋值"""
+
+    __slots__ = ()
+
+    def __init__(self, data: Dict):
+        for key in self.__slots__:
+            if key in data:
+                setattr(self, key, data[key])
+
     def __repr__(self) -> str:
-        return self.__dict__.__repr__()
+        return {
+            k: getattr(self, k) for k in self.__slots__ if hasattr(self, k)
+        }.__repr__()
 
 
 class BasicStat(DataStruct):
+    __slots__ = ("level", "platform", "region")
     level: int
     platform: str
     region: str  # apac emea ncsa
 
-    def __init__(self, data: Dict):
-        self.__dict__.update(data)
-
 
 class SeasonRanks(DataStruct):
+    __slots__ = ("season", "mmr", "max_mmr", "wins", "losses")
     # season: str            # 当前赛季
     season: int  # 赛季数
     mmr: int  # 最终mmr分数
@@ -24,9 +36,6 @@ class SeasonRanks(DataStruct):
     wins: int  # 胜场
     losses: int  # 败场
 
-    def __init__(self, data: dict):
-        self.__dict__.update(data)
-
     def get_season(self) -> str:
         # """Y6S4 = 24 -> (6-1)*4 + 4"""
         # # 第一步取余数
@@ -53,24 +62,16 @@ class SeasonRanks(DataStruct):
 
 
 class GeneralStat(DataStruct):
-    killAssists: int  # 协助击杀
+    __slots__ = ("kills", "deaths", "headshot", "timePlayed", "played", "won", "lost")
     kills: int  # 击杀
     deaths: int  # 死亡
-    meleeKills: int  # 近战击杀
-    penetrationKills: int  # 穿透击杀
     headshot: int  # 爆头击杀
-    revives: int  # 救助次数
-    bulletsHit: int  # 子弹命中数
-    bulletsFired: int  # 发射子弹数
 
     timePlayed: int  # 游玩时间
     played: int  # 游玩局数
     won: int  # 胜利局数
     lost: int  # 失败局数
 
-    def __init__(self, data: Dict):
-        self.__dict__.update(data)
-
     def kd(self) -> str:
         if self.deaths == 0:
             return "∞"
@@ -81,6 +82,7 @@ class GeneralStat(DataStruct):
 
 
 class CRStat(DataStruct):
+    __slots__ = ("model", "kills", "deaths", "timePlayed", "played", "won", "lost", "mmr", "time")
     model: str  # 模式 casual or ranked
     kills: int  # 击杀
     deaths: int  # 死亡
@@ -92,7 +94,7 @@ class CRStat(DataStruct):
     time: int  # 时间 ms timestamp
 
     def __init__(self, data: Dict) -> None:
-        self.__dict__.update(data)
+        super().__init__(data)
         if data.get("update_at") is not None:
             self.time = data["update_at"]["time"]
 
@@ -112,6 +114,7 @@ class CRStat(DataStruct):
 
 
 class OperatorStat(DataStruct):
+    __slots__ = ("name", "kills", "deaths", "timePlayed", "won", "lost", "played")
     name: str
     kills: int
     deaths: int
@@ -121,7 +124,7 @@ class OperatorStat(DataStruct):
     played: int
 
     def __init__(self, data: Dict) -> None:
-        self.__dict__.update(data)
+        super().__init__(data)
         self.played = self.won + self.lost
 
     def kd(self) -> str:
@@ -136,16 +139,33 @@ class OperatorStat(DataStruct):
 
 
 class Player(DataStruct):
+    """玩家数据，干员、历史段位和近期对战在首次访问时才解析"""
+
+    __slots__ = (
+        "username",
+        "user_id",
+        "basic_stat",
+        "gerneral_stat",
+        "casual_stat",
+        "ranked_stat",
+        "source",
+        "missing",
+        "_raw_seasons",
+        "_raw_recent",
+        "_raw_operators",
+        "_season_rank",
+        "_history_max_mmr_season",
+        "_recent_stat",
+        "_operator_stat",
+    )
     username: str
     user_id: str
     basic_stat: List[BasicStat]  # 感觉是各服务器数据
     gerneral_stat: GeneralStat  # 综合数据
     casual_stat: CRStat
     ranked_stat: Optional[CRStat]
-    season_rank: List[SeasonRanks]  # 历史段位数据
-    history_max_mmr_season: Dict  # 按照要求增加历史最高mmr
-    recent_stat: List[CRStat]  # 最近对战的数据
-    operator_stat: List[OperatorStat]  # 干员数据
+    source: str  # 数据来源
+    missing: Tuple[str, ...]  # 数据来源无法提供的字段，见 sources.MISSING_LABELS
 
     def __init__(self, username: str, user_id: str) -> None:
         self.username = username
@@ -154,10 +174,71 @@ class Player(DataStruct):
         self.gerneral_stat = GeneralStat({})
         self.casual_stat = CRStat({})
         self.ranked_stat = None
-        self.history_max_mmr_season = {}
-        self.season_rank = []
-        self.recent_stat = []
-        self.operator_stat = []
+        self.source = "r6scn"
+        self.missing = ()
+        self._raw_seasons: List[Dict] = []
+        self._raw_recent: List[Dict] = []
+        self._raw_operators: List[Dict] = []
+        self._season_rank: Optional[List[SeasonRanks]] = None
+        self._history_max_mmr_season: Optional[Dict] = None
+        self._recent_stat: Optional[List[CRStat]] = None
+        self._operator_stat: Optional[List[OperatorStat]] = None
+
+    def _parse_seasons(self) -> None:
+        seen = set()
+        seasons = []
+        for d in self._raw_seasons:
+            if d["season"] not in seen:
+                seen.add(d["season"])
+                seasons.append(d)
+        self._season_rank = [SeasonRanks(d) for d in seasons]
+        # 与稳定排序后取第一个一致：max_mmr 相同时取先出现的赛季
+        self._history_max_mmr_season = max(seasons, key=lambda x: x["max_mmr"], default={})
+        self._raw_seasons = []
+
+    @property
+    def season_rank(self) -> List[SeasonRanks]:  # 历史段位数据
+        if self._season_rank is None:
+            self._parse_seasons()
+        return self._season_rank
+
+    @property
+    def history_max_mmr_season(self) -> Dict:  # 按照要求增加历史最高mmr
+        if self._history_max_mmr_season is None:
+            self._parse_seasons()
+        return self._history_max_mmr_season
+
+    @property
+    def recent_stat(self) -> List[CRStat]:  # 最近对战的数据
+        if self._recent_stat is None:
+            self._recent_stat = [CRStat(d) for d in self._raw_recent]
+            self._raw_recent = []
+        return self._recent_stat
+
+    @property
+    def operator_stat(self) -> List[OperatorStat]:  # 干员数据
+        if self._operator_stat is None:
+            self._operator_stat = [OperatorStat(d) for d in self._raw_operators]
+            self._raw_operators = []
+        return self._operator_stat
+
+    def snapshot(self, seasons: bool = False, best_season: bool = False, operators: int = 0) -> "Player":
+        """只带卡片用到的部分的副本，用作渲染任务的输入
+
+        需要的懒解析部分预先解析好，其余部分置空，进程池模式下不必把整份原始数据传给渲染进程
+        """
+        player = Player(self.username, self.user_id)
+        player.basic_stat = self.basic_stat
+        player.gerneral_stat = self.gerneral_stat
+        player.casual_stat = self.casual_stat
+        player.ranked_stat = self.ranked_stat
+        player.source = self.source
+        player.missing = self.missing
+        player._season_rank = self.season_rank if seasons else []
+        player._history_max_mmr_season = self.history_max_mmr_season if seasons or best_season else {}
+        player._recent_stat = []
+        player._operator_stat = self.operator_stat[:operators]
+        return player
 
     def level(self) -> int:
         level = 0
@@ -165,18 +246,9 @@ class Player(DataStruct):
             level = max(level, stat.level)
         return level
 
-    async def get_avatar(self, retry_times=0) -> Union[bytes, None]:
-        try:
-            AVATAR_BASE = "https://ubisoft-avatars.akamaized.net/{}/default_146_146.png"
-            async with httpx.AsyncClient() as client:
-                avataUrl = AVATAR_BASE.format(self.user_id)
-                r = await client.get(avataUrl)
-                return r.content
-        except:
-            if retry_times < 3:
-                return await self.get_avatar(retry_times + 1)
-            else:
-                return None
+    async def get_avatar(self) -> Union[bytes, None]:
+        with metrics.span("avatar"):
+            return await avatar_cache.get_bytes(self.user_id)
 
     def casual_rank(self) -> int:
         return rank(self.casual_stat.mmr)
@@ -219,21 +291,11 @@ def new_player_from_r6scn(data: Dict) -> Player:
         elif d["model"] == "ranked":
             player.ranked_stat = CRStat(d)
             player.ranked_stat.mmr = data["Basicstat"][0]["mmr"]
-    for d in data["StatCR2"]:
-        player.recent_stat.append(CRStat(d))
-    for d in data["StatOperator"]:
-        player.operator_stat.append(OperatorStat(d))
-
-    dup_seasonid = []
-    seasonranks = []
-
-    for d in data["SeasonRanks"]:
-        if d["season"] not in dup_seasonid:
-            player.season_rank.append(SeasonRanks(d))
-            dup_seasonid.append(d["season"])
-            seasonranks.append(d)
-
-    seasonranks.sort(key=lambda x: x["max_mmr"], reverse=True)
-    player.history_max_mmr_season = seasonranks[0]
+    # 以下部分只有部分卡片会用到，先保留原始数据，首次访问时再解析
+    player._raw_recent = data["StatCR2"]
+    player._raw_operators = data["StatOperator"]
+    player._raw_seasons = data["SeasonRanks"]
+    player.source = data.get("source", "r6scn")
+    player.missing = tuple(data.get("missing", ()))
 
     return player
@@ -0,0 +1,69 @@
+import asyncio
+from typing import List, Optional, Union
+
+from .cache import SingleFlight, TTLCache
+from .avatar import avatar_cache
+from .config import plugin_config
+from .history import history
+from .id_index import id_index, normalize_username
+from .player import Player, new_player_from_r6scn
+from .sources import fetcher
+
+player_cache = TTLCache(
+    plugin_config.r6s_player_cache_size, plugin_config.r6s_player_cache_ttl
+)
+player_flight = SingleFlight()
+
+
+async def _fetch(username: str, ttl: Optional[float] = None) -> Union[Player, str]:
+    key = normalize_username(username)
+    # 已知 ubisoft_id 时头像下载与战绩查询同时进行
+    ubi_id = id_index.get_id(username)
+    if ubi_id:
+        avatar_cache.prefetch(ubi_id)
+    data = await fetcher.fetch(username)
+    if data == "Not Found" and ubi_id:
+        # 玩家改过名时用索引中该 id 最近的昵称再查一次
+        latest = id_index.get_name(ubi_id)
+        if latest and normalize_username(latest) != key:
+            data = await fetcher.fetch(latest)
+    if not isinstance(data, dict):
+        # "Not Found"，或所有数据源都出错时的 ""
+        return data or ""
+    player = new_player_from_r6scn(data)
+    id_index.add(username, player.user_id)
+    id_index.add(player.username, player.user_id)
+    history.record(player)
+    player_cache.set(key, player, ttl)
+    return player
+
+
+async def get_player(username: str) -> Union[Player, str]:
+    """查询玩家，TTL 内同名查询直接复用已解析的 Player，并发的同名查询共用一次请求
+
+    未找到时返回 "Not Found"，所有数据源都出错时返回 ""
+    """
+    key = normalize_username(username)
+    player = player_cache.get(key)
+    if player is not None:
+        return player
+    return await player_flight.do(key, lambda: _fetch(username))
+
+
+async def refresh_player(username: str, ttl: float) -> Union[Player, str]:
+    """忽略缓存重新查询玩家，结果以 ttl 秒的有效期写入缓存"""
+    return await player_flight.do(normalize_username(username), lambda: _fetch(username, ttl))
+
+
+async def get_players(usernames: List[str]) -> List[Union[Player, str]]:
+    """并发查询多名玩家，失败的玩家返回 "Not Found" 或 "Error"，不影响其他玩家"""
+    limit = asyncio.Semaphore(plugin_config.r6s_batch_concurrency)
+
+    async def _get(username: str) -> Union[Player, str]:
+        async with limit:
+            try:
+                return await get_player(username) or "Error"
+            except Exception:
+                return "Error"
+
+    return list(await asyncio.gather(*map(_get, usernames)))
@@ -1,5 +1,4 @@
-import httpx
-import asyncio
+from .net import get_data_from_r6scn
 
 
 def rank(mmr: int) -> str:
@@ -26,33 +25,8 @@ def rank(mmr: int) -> str:
         return head[-1]
 
 
-async def get_data(usr_name: str, trytimes=6) -> dict:
-    if trytimes == 0:
-        return ""
-    try:
-        base_url = "https://www.r6s.cn/Stats?username="
-        url = base_url + str(usr_name) + '&platform='
-        headers = {
-            'Host': 'www.r6s.cn',
-            'referer': 'https://www.r6s.cn',
-            'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.116 Safari/537.36',
-            'x-requested-with': 'XMLHttpRequest'
-        }
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers)
-        if not response.json() and trytimes == 1:
-            return "Not Found"
-        r: dict = response.json()
-        if not (r.get("username") or r.get("StatCR")):
-            trytimes -= 1
-            await asyncio.sleep(0.5)
-            r = await get_data(usr_name, trytimes=trytimes)
-        return r
-    except:
-        trytimes -= 1
-        await asyncio.sleep(0.5)
-        r = await get_data(usr_name, trytimes=trytimes)
-        return r
+async def get_data(usr_name: str) -> dict:
+    return await get_data_from_r6scn(usr_name)
 
 
 def con(*args) -> str:
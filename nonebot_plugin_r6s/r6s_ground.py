@@ -1,21 +1,24 @@
-from httpx import AsyncClient
 import ujson as json
-import asyncio
 import re
+import httpx
+from typing import Iterable
 
+from nonebot.log import logger
 
-from .r6s_stats import get_stats
+from .config import plugin_config
+from .net import check_response, fetch, retry_policy
+from .retry import RetryableError
+from .r6s_stats import lookup_id
 
 
 async def get_id(name: str):
-    id = await get_stats(name)
+    id = await lookup_id(name)
     if id:
         return id
 
     '''
     # 从R6_ground搜索获取ubi_id
-    async with AsyncClient() as client:
-        resp = await client.get("https://global.r6sground.cn/cache/%s/search" % name)
+    resp = await fetch("%s/cache/%s/search" % (plugin_config.r6s_ground_base, name))
     data = resp.json()
     if data["hits"]:
         return data["hits"]["u0"]["uplayMainId"]
@@ -24,83 +27,135 @@ async def get_id(name: str):
     return "Not Found"
 
 
-async def _get_data(ubi_id: str) -> dict:
-    async with AsyncClient() as client:
-        resp = await client.get("https://global.r6sground.cn/stats/%s/data" % ubi_id)
-    datas = re.split(r"(data: )", resp.text)
+# ground 数据把常见的字符串替换成了 !N$ 形式的编号，键名和值都会被替换
+# 编号含义由 R6 官方统计字段名（如 generalpvp_kills:infinite）反推，未知的编号保持原样
+TOKENS = {
+    b"5": b"infinite",
+    b"6": b"kill",
+    b"7": b"death",
+    b"8": b"won",
+    b"9": b"lost",
+    b"14": b"headshot",
+    b"15": b"generalpvp",
+    b"19": b"match",
+    b"26": b"rank",
+    b"31": b"timeplayed",
+    b"32": b"played",
+    b"46": b"false",
+    b"47": b"true",
+}
+TOKEN_RE = re.compile(rb"!(\d+)\$")
+CHUNK_KEY_RE = re.compile(rb'\{\s*"key"\s*:\s*"([^"]*)"')
+
+
+def _expand(m: "re.Match") -> bytes:
+    return TOKENS.get(m.group(1), m.group(0))
+
+
+def decode(payload: bytes, keys: Iterable[str] = ("userMainData",)) -> dict:
+    """解码 ground 的分段数据，只对 keys 中的分段做编号替换和 json 解析"""
+    keys = set(keys)
     rdatas = {}
-    for d in datas:
-        if d[:1] != "{":
-            pass
-        else:
-            d = d.replace("!46$", "false")
-            d = d.replace("!47$", "true")
-            d_jdson = json.loads(d)
-            rdatas[d_jdson["key"]] = d_jdson["data"]
+    for chunk in payload.split(b"data: "):
+        chunk = chunk.strip()
+        if chunk[:1] != b"{":
+            continue
+        m = CHUNK_KEY_RE.match(chunk)
+        if m is not None and m.group(1).decode() not in keys:
+            continue
+        d = json.loads(TOKEN_RE.sub(_expand, chunk))
+        if d["key"] in keys:
+            rdatas[d["key"]] = d["data"]
+    return rdatas
+
+
+def check_data(rdatas: dict) -> dict:
     if not rdatas.get("userMainData"):
         return "Not Found"
-    elif not rdatas["userMainData"].get("!15$_!6$s:!5$"):
+    elif not rdatas["userMainData"].get("generalpvp_kills:infinite"):
         return "Not Found"  # 应该是有ubi账号但没打过R6
     return rdatas
 
 
-async def get_data(name: str, retry: int = 3) -> dict:
+async def _get_data(ubi_id: str) -> dict:
+    resp = await fetch("%s/stats/%s/data" % (plugin_config.r6s_ground_base, ubi_id))
+    check_response(resp)
+    return check_data(decode(resp.content))
+
+
+async def get_data(name: str) -> dict:
     ubi_id = await get_id(name)
     if ubi_id == "Not Found" or not ubi_id:
         return "Not Found"
-    rdata = await _get_data(ubi_id)
-    while rdata == "Not Found" and retry != 0:
-        await asyncio.sleep(1)
+
+    async def _attempt() -> dict:
         rdata = await _get_data(ubi_id)
-        retry -= 1
-    if retry == 0:
-        return "Not Found"
-    return trans_data(rdata)
+        if rdata == "Not Found":
+            # 第一次查询可能返回未更新的数据，稍后重试
+            raise RetryableError("Not Found", host_failure=False)
+        return rdata
+
+    try:
+        rdata = await retry_policy.call(httpx.URL(plugin_config.r6s_ground_base).host, _attempt)
+    except RetryableError as e:
+        if not e.host_failure:
+            return "Not Found"
+        logger.warning("r6sground 查询失败『%s』: %s" % (name, e))
+        return ""
+    except Exception as e:
+        # 超时、5xx、熔断、数据无法解码等都是出错而不是查无此人
+        logger.warning("r6sground 查询失败『%s』: %r" % (name, e))
+        return ""
+    return trans_data(rdata, ubi_id)
 
 
-def trans_data(data: dict) -> dict:
+def trans_data(data: dict, ubi_id: str = "") -> dict:
+    """转换为 r6s.cn 的格式，ground 数据中没有近期对战、干员和历史段位"""
     rdict = {
         "username": data["userMainData"]["UsernameOnPlatform"],
         "Casualstat": {
-            "mmr": int(data["userMainData"]["pvp_casual_s!6$_mean"])
+            "user_id": ubi_id,
+            "mmr": int(data["userMainData"]["pvp_casual_skill_mean"])
         },
         "Basicstat": [
             {
                 "level": data["userMainData"]["!100$"],
-                "mmr": int(data["userMainData"]["!26$_!28$_mmr"])
+                "mmr": int(data["userMainData"]["rank_!28$_mmr"])
             }
         ],
         "StatGeneral": [
             {
-                "kills": data["userMainData"]["!15$_!6$s:!5$"],
-                "deaths": data["userMainData"]["!15$_!7$:!5$"],
-                "won": data["userMainData"]["!15$_!19$!8$:!5$"],
-                "lost": data["userMainData"]["!15$_!19$!9$:!5$"],
-                "played": data["userMainData"]["!15$_!19$!32$:!5$"],
-                "timePlayed": data["userMainData"]["!15$_!31$:!5$"],
-                "headshot": data["userMainData"]["!15$_!14$:!5$"],
+                "kills": data["userMainData"]["generalpvp_kills:infinite"],
+                "deaths": data["userMainData"]["generalpvp_death:infinite"],
+                "won": data["userMainData"]["generalpvp_matchwon:infinite"],
+                "lost": data["userMainData"]["generalpvp_matchlost:infinite"],
+                "played": data["userMainData"]["generalpvp_matchplayed:infinite"],
+                "timePlayed": data["userMainData"]["generalpvp_timeplayed:infinite"],
+                "headshot": data["userMainData"]["generalpvp_headshot:infinite"],
             }
         ],
         "StatCR": [
             {
-                "kills": data["userMainData"]["casualpvp_!6$s:!5$"],
-                "deaths": data["userMainData"]["casualpvp_!7$:!5$"],
-                "won": data["userMainData"]["casualpvp_!19$!8$:!5$"],
-                "lost": data["userMainData"]["casualpvp_!19$!9$:!5$"],
-                "played": data["userMainData"]["casualpvp_!19$!32$:!5$"],
-                "timePlayed": data["userMainData"]["casualpvp_!31$:!5$"],
+                "model": "casual",
+                "kills": data["userMainData"]["casualpvp_kills:infinite"],
+                "deaths": data["userMainData"]["casualpvp_death:infinite"],
+                "won": data["userMainData"]["casualpvp_matchwon:infinite"],
+                "lost": data["userMainData"]["casualpvp_matchlost:infinite"],
+                "played": data["userMainData"]["casualpvp_matchplayed:infinite"],
+                "timePlayed": data["userMainData"]["casualpvp_timeplayed:infinite"],
             }
         ]
     }
-    if data["userMainData"].get("!26$edpvp_!6$s:!5$"):
+    if data["userMainData"].get("rankedpvp_kills:infinite"):
         rdict["StatCR"].append(
             {
-                "kills": data["userMainData"].get("!26$edpvp_!6$s:!5$"),
-                "deaths": data["userMainData"].get("!26$edpvp_!7$:!5$"),
-                "won": data["userMainData"].get("!26$edpvp_!19$!8$:!5$"),
-                "lost": data["userMainData"].get("!26$edpvp_!19$!9$:!5$"),
-                "played": data["userMainData"].get("!26$edpvp_!19$!32$:!5$"),
-                "timePlayed": data["userMainData"].get("!26$edpvp_!31$:!5$"),
+                "model": "ranked",
+                "kills": data["userMainData"].get("rankedpvp_kills:infinite"),
+                "deaths": data["userMainData"].get("rankedpvp_death:infinite"),
+                "won": data["userMainData"].get("rankedpvp_matchwon:infinite"),
+                "lost": data["userMainData"].get("rankedpvp_matchlost:infinite"),
+                "played": data["userMainData"].get("rankedpvp_matchplayed:infinite"),
+                "timePlayed": data["userMainData"].get("rankedpvp_timeplayed:infinite"),
             }
         )
     return rdict
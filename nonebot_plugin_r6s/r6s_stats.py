@@ -1,15 +1,88 @@
-from httpx import AsyncClient
+from .cache import SingleFlight, TTLCache
+from .config import plugin_config
+from .id_index import id_index, normalize_username
+from .net import fetch
+
+search_flight = SingleFlight()
+# 搜不到的昵称短时间内不再搜索，对冲时后启动的数据源直接复用结果
+search_misses = TTLCache(1024, 60.0)
 
 
 # 从R6stats获取ubi_id或者标准信息
 async def get_stats(name: str, full_return: bool = False):
-    async with AsyncClient() as client:
-        resp = await client.get("https://r6stats.com/api/player-search/%s/pc" % name)
+    resp = await fetch("%s/api/player-search/%s/pc" % (plugin_config.r6s_stats_base, name))
     data = resp.json()["data"]
+    for player in data:
+        id_index.add(player.get("username", ""), player.get("ubisoft_id", ""))
     if data:
+        id_index.add(name, data[0]["ubisoft_id"])
         if full_return:
             return data
         else:
             return data[0]["ubisoft_id"]
     else:
         return False
+
+
+async def lookup_id(name: str):
+    """昵称对应的 ubisoft_id，先查索引；r6sground 与 r6stats 查询同一昵称时共用一次搜索"""
+    ubi_id = id_index.get_id(name)
+    if ubi_id:
+        return ubi_id
+    key = normalize_username(name)
+    if key in search_misses:
+        return False
+    ubi_id = await search_flight.do(key, lambda: get_stats(name))
+    if not ubi_id:
+        search_misses.set(key, True)
+    return ubi_id
+
+
+def _queue(model: str, data: dict) -> dict:
+    return {
+        "model": model,
+        "kills": data.get("kills", 0),
+        "deaths": data.get("deaths", 0),
+        "won": data.get("wins", 0),
+        "lost": data.get("losses", 0),
+        "played": data.get("games_played", 0),
+        "timePlayed": data.get("playtime", 0),
+    }
+
+
+def trans_data(data: dict) -> dict:
+    """转换为 r6s.cn 的格式，r6stats 的综合数据中没有 MMR、近期对战和历史段位"""
+    general = data["stats"]["general"]
+    queue = data["stats"].get("queue", {})
+    rdict = {
+        "username": data["username"],
+        "Casualstat": {"user_id": data["ubisoft_id"], "mmr": 0},
+        "Basicstat": [{"level": data.get("progression", {}).get("level", 0), "mmr": 0}],
+        "StatGeneral": [
+            {
+                "kills": general["kills"],
+                "deaths": general["deaths"],
+                "won": general["wins"],
+                "lost": general["losses"],
+                "played": general["games_played"],
+                "timePlayed": general["playtime"],
+                "headshot": general.get("headshots", 0),
+            }
+        ],
+        "StatCR": [_queue("casual", queue.get("casual", {}))],
+    }
+    if queue.get("ranked", {}).get("games_played"):
+        rdict["StatCR"].append(_queue("ranked", queue["ranked"]))
+    if "operators" in data:
+        rdict["StatOperator"] = [
+            {
+                "name": op["name"],
+                "kills": op.get("kills", 0),
+                "deaths": op.get("deaths", 0),
+                "won": op.get("wins", 0),
+                "lost": op.get("losses", 0),
+                "timePlayed": op.get("playtime", 0),
+            }
+            for op in data["operators"]
+        ]
+    return rdict
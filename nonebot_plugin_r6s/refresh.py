@@ -0,0 +1,131 @@
+import asyncio
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from nonebot.log import logger
+
+from .avatar import avatar_cache
+from .binding import BindingStore, bindings
+from .config import plugin_config
+from .id_index import normalize_username
+from .limiter import Limiter, limiter
+from .metrics import metrics
+from .player import Player
+from .query import player_cache, refresh_player
+
+
+class RefreshScheduler:
+    """按固定的低速率在后台刷新绑定玩家的数据，使不带参数的查询直接命中缓存
+
+    最近查询过的玩家优先；只在允许的时段、且没有交互查询在处理或排队时刷新；
+    上游出错时刷新间隔按 2 的幂退避，成功后恢复
+    """
+
+    def __init__(
+        self,
+        store: BindingStore,
+        admission: Limiter,
+        rate: float,
+        hours: List[int],
+        age: float,
+        ttl: float,
+        max_backoff: float,
+        idle_poll: float = 1.0,
+    ) -> None:
+        self.store = store
+        self.admission = admission
+        self.interval = 1 / rate if rate > 0 else 0
+        self.hours = set(hours)
+        self.age = age
+        self.ttl = ttl
+        self.max_backoff = max_backoff
+        self.idle_poll = idle_poll
+        self.failures = 0
+        self.outcomes: Counter = Counter()
+        self._active: Dict[str, float] = {}
+        self._refreshed: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, username: str) -> None:
+        """记录绑定玩家被查询的时间"""
+        self._active[normalize_username(username)] = time.time()
+
+    def in_window(self) -> bool:
+        return not self.hours or time.localtime().tm_hour in self.hours
+
+    def delay(self) -> float:
+        return min(self.max_backoff, self.interval * 2 ** self.failures)
+
+    def next(self) -> Optional[str]:
+        """最近查询过的玩家优先，只考虑缓存放得下的前一半，跳过不久前刚刷新过的"""
+        names = {}
+        for _, username in self.store.items():
+            names.setdefault(normalize_username(username), username)
+        ordered = sorted(names, key=lambda k: self._active.get(k, 0), reverse=True)
+        now = time.time()
+        for key in ordered[: max(1, player_cache.maxsize // 2)]:
+            if now - self._refreshed.get(key, 0) >= self.age:
+                return names[key]
+        return None
+
+    async def refresh(self, username: str) -> bool:
+        """刷新一名玩家，上游出错时返回 False"""
+        self._refreshed[normalize_username(username)] = time.time()
+        try:
+            with metrics.span("refresh"):
+                player = await refresh_player(username, self.ttl)
+        except Exception as e:
+            logger.debug("后台刷新失败『%s』: %r" % (username, e))
+            player = None
+        if isinstance(player, Player):
+            avatar_cache.prefetch(player.user_id)
+            result = "ok"
+        elif player == "Not Found":
+            result = "not_found"
+        else:
+            result = "error"
+        self.outcomes[result] += 1
+        return result != "error"
+
+    async def _idle(self) -> None:
+        # 交互查询优先，有查询在处理或排队时不刷新
+        while self.admission.active or self.admission.waiting:
+            await asyncio.sleep(self.idle_poll)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.delay())
+            if not self.in_window():
+                continue
+            await self._idle()
+            username = self.next()
+            if username is None:
+                continue
+            if await self.refresh(username):
+                self.failures = 0
+            elif self.interval * 2 ** self.failures < self.max_backoff:
+                self.failures += 1
+
+    async def start(self) -> None:
+        if self.interval and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"backoff": self.delay(), **self.outcomes}
+
+
+refresher = RefreshScheduler(
+    bindings,
+    limiter,
+    plugin_config.r6s_refresh_rate,
+    plugin_config.r6s_refresh_hours,
+    plugin_config.r6s_refresh_age,
+    plugin_config.r6s_refresh_ttl,
+    plugin_config.r6s_refresh_max_backoff,
+)
@@ -0,0 +1,100 @@
+import asyncio
+import functools
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from nonebot.log import logger
+
+from .config import plugin_config
+
+
+def _warm_up() -> None:
+    # fork 出的进程通常已继承字体和图标，这里保证其余情况下也在首个任务前加载完毕
+    from .image import _warm_up as load_assets
+
+    load_assets()
+
+
+class RenderPool:
+    """在线程池或进程池中执行 Pillow 绘图与编码，避免阻塞事件循环
+
+    kind 为 "thread"、"process" 或 "none"（在事件循环中直接执行）
+    """
+
+    def __init__(self, kind: str, workers: int) -> None:
+        self.kind = kind
+        self.workers = workers
+        self._executor: Optional[Executor] = None
+        self.pending = 0  # 已提交未完成的任务数
+        self.max_pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def _new_executor(self) -> Optional[Executor]:
+        if self.kind == "process":
+            if "fork" in multiprocessing.get_all_start_methods():
+                return ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context("fork"),
+                    initializer=_warm_up,
+                )
+            logger.warning("当前平台不支持 fork，渲染进程池已回退为线程池")
+            self.kind = "thread"
+        if self.kind == "thread":
+            return ThreadPoolExecutor(self.workers, thread_name_prefix="r6s-render")
+        return None
+
+    def start(self) -> None:
+        """创建线程池或进程池，进程池会等待全部进程启动并完成预加载"""
+        if self._executor is None:
+            self._executor = self._new_executor()
+        if isinstance(self._executor, ProcessPoolExecutor):
+            # 预先拉起全部进程，首个查询不必等待进程启动
+            for f in [self._executor.submit(_warm_up) for _ in range(self.workers)]:
+                f.result()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self._executor is None and self.kind != "none":
+            # 未经 start 时按需创建，不在事件循环中等待进程启动，进程由 initializer 完成预加载
+            self._executor = self._new_executor()
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        start = time.perf_counter()
+        try:
+            if self._executor is None:
+                return func(*args)
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            cost = time.perf_counter() - start
+            self.pending -= 1
+            self.completed += 1
+            self.total_time += cost
+            self.max_time = max(self.max_time, cost)
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_time": self.total_time / self.completed if self.completed else 0.0,
+            "max_time": self.max_time,
+        }
+
+
+render_pool = RenderPool(plugin_config.r6s_render_pool, plugin_config.r6s_render_workers)
@@ -0,0 +1,132 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Type, TypeVar
+
+import httpx
+
+from .metrics import metrics
+
+T = TypeVar("T")
+
+
+class RetryableError(Exception):
+    """可重试的错误，host_failure 为 False 时不计入熔断（如查无此人的空数据）"""
+
+    def __init__(self, msg: str, host_failure: bool = True) -> None:
+        super().__init__(msg)
+        self.host_failure = host_failure
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+RETRYABLE: Tuple[Type[BaseException], ...] = (
+    RetryableError,
+    httpx.TransportError,
+    asyncio.TimeoutError,
+)
+
+
+class CircuitBreaker:
+    """连续失败达到阈值后熔断，冷却后放行一次探测请求"""
+
+    def __init__(self, threshold: int, cooldown: float) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._probing or time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self._probing or time.monotonic() - self.opened_at < self.cooldown:
+            return False
+        self._probing = True
+        return True
+
+    def release(self) -> None:
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+
+class RetryPolicy:
+    """指数退避（full jitter）+ 单次查询总时长预算 + 按 host 熔断"""
+
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        base_delay: float = 0.3,
+        max_delay: float = 2.0,
+        budget: float = 8.0,
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 30.0,
+    ) -> None:
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(
+                self.breaker_threshold, self.breaker_cooldown
+            )
+        return breaker
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    async def call(self, host: str, func: Callable[[], Awaitable[T]]) -> T:
+        breaker = self.breaker(host)
+        deadline = time.monotonic() + self.budget
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                metrics.inc("r6s_circuit_open_total", host=host)
+                raise CircuitOpenError(host)
+            attempt += 1
+            if attempt > 1:
+                metrics.inc("r6s_retries_total", host=host)
+            try:
+                result = await asyncio.wait_for(func(), max(deadline - time.monotonic(), 0))
+            except RETRYABLE as e:
+                if getattr(e, "host_failure", True):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                delay = self.backoff(attempt)
+                if attempt >= self.max_attempts or time.monotonic() + delay >= deadline:
+                    raise
+            except BaseException:
+                # 不可重试的错误不代表 host 不健康，但要释放探测名额
+                breaker.release()
+                raise
+            else:
+                breaker.record_success()
+                return result
+            await asyncio.sleep(delay)
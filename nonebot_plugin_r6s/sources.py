@@ -0,0 +1,139 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, NamedTuple, Tuple, Union
+
+from nonebot.log import logger
+
+from .config import plugin_config
+from .metrics import metrics
+from .net import get_data_from_r6scn, get_data_from_r6stats
+from .r6s_ground import get_data as get_data_from_r6sground
+
+# new_player_from_r6scn 用到的各部分，数据源没有提供的部分补为空并记入 missing
+SECTIONS = ("Basicstat", "StatGeneral", "StatCR", "StatCR2", "StatOperator", "SeasonRanks")
+MISSING_LABELS = {
+    "mmr": "MMR",
+    "StatCR2": "近期对战",
+    "StatOperator": "干员",
+    "SeasonRanks": "历史段位",
+}
+
+
+class Source(NamedTuple):
+    name: str
+    fetch: Callable[[str], Awaitable[Union[dict, str]]]
+    missing: Tuple[str, ...] = ()  # 返回的数据中有但取不到真实值的字段
+
+
+SOURCES = {
+    "r6scn": Source("r6scn", get_data_from_r6scn),
+    "r6sground": Source("r6sground", get_data_from_r6sground),
+    "r6stats": Source("r6stats", get_data_from_r6stats, ("mmr",)),
+}
+
+
+def normalize(data: dict, source: Source) -> dict:
+    """补齐 r6s.cn 格式中缺少的部分，并记录数据来源和缺失的字段"""
+    data = dict(data)
+    missing = list(source.missing)
+    for key in SECTIONS:
+        if key not in data:
+            data[key] = [{}] if key == "StatGeneral" else []
+            if key in MISSING_LABELS:
+                missing.append(key)
+    data["Casualstat"] = dict({"user_id": "", "mmr": 0}, **data.get("Casualstat", {}))
+    data["source"] = source.name
+    data["missing"] = missing
+    return data
+
+
+class HedgedFetcher:
+    """按顺序使用多个数据源：前一个数据源在其历史耗时的分位数内没有返回时，
+    再向下一个数据源发起对冲请求；前一个失败时立即启用下一个。
+    取最先返回的有效数据，其余请求全部取消
+    """
+
+    def __init__(
+        self,
+        sources: List[Source],
+        percentile: float,
+        initial_delay: float,
+        min_delay: float,
+        max_delay: float,
+        window: int = 200,
+        min_samples: int = 20,
+    ) -> None:
+        self.sources = sources
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self._latency: Dict[str, Deque[float]] = {s.name: deque(maxlen=window) for s in sources}
+
+    def delay(self, source: Source) -> float:
+        samples = self._latency[source.name]
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        ordered = sorted(samples)
+        value = ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+        return min(self.max_delay, max(self.min_delay, value))
+
+    async def _run(self, source: Source, username: str) -> Union[dict, str]:
+        start = time.perf_counter()
+        try:
+            with metrics.span("source", source=source.name):
+                result = await source.fetch(username)
+        except Exception as e:
+            logger.warning("%s 查询失败『%s』: %r" % (source.name, username, e))
+            return ""
+        if isinstance(result, dict):
+            self._latency[source.name].append(time.perf_counter() - start)
+        return result
+
+    async def fetch(self, username: str) -> Union[dict, str]:
+        """返回 r6s.cn 格式的数据；所有数据源都失败时返回 "Not Found" 或 "" """
+        queue = list(self.sources)
+        pending: Dict[asyncio.Future, Source] = {}
+        not_found = False
+
+        def launch() -> Source:
+            source = queue.pop(0)
+            pending[asyncio.ensure_future(self._run(source, username))] = source
+            return source
+
+        current = launch()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    list(pending),
+                    timeout=self.delay(current) if queue else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    metrics.inc("r6s_hedges_total", source=queue[0].name)
+                    current = launch()
+                    continue
+                for task in done:
+                    source = pending.pop(task)
+                    result = task.result()
+                    if isinstance(result, dict):
+                        metrics.inc("r6s_source_wins_total", source=source.name)
+                        return normalize(result, source)
+                    not_found = not_found or result == "Not Found"
+                    if queue:
+                        current = launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        return "Not Found" if not_found else ""
+
+
+fetcher = HedgedFetcher(
+    [SOURCES[name] for name in plugin_config.r6s_sources if name in SOURCES] or [SOURCES["r6scn"]],
+    plugin_config.r6s_hedge_percentile,
+    plugin_config.r6s_hedge_delay,
+    plugin_config.r6s_hedge_min_delay,
+    plugin_config.r6s_hedge_max_delay,
+)